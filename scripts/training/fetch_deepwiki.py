@@ -8,8 +8,8 @@ Output format is compatible with format_training_data.py (same as raw_docs.jsonl
     {"repo": "linkerd/linkerd2", "path": "<section-slug>", "title": "...", "content": "..."}
 
 Usage:
-    # Primary method (requests + BeautifulSoup):
-    pip install requests beautifulsoup4 html2text
+    # Primary method (requests + selectolax):
+    pip install requests selectolax html2text orjson
     python fetch_deepwiki.py
 
     # If pages render blank (JS-only), use Playwright:
@@ -20,13 +20,14 @@ Usage:
 """
 
 import argparse
-import json
+import asyncio
 import time
 from pathlib import Path
 
 import html2text
+import orjson
 import requests
-from bs4 import BeautifulSoup
+from selectolax.lexbor import LexborHTMLParser, LexborNode
 
 BASE_URL = "https://deepwiki.com"
 
@@ -86,11 +87,27 @@ HEADERS = {
 }
 
 MIN_CONTENT_LEN = 300   # if extracted text is shorter, assume JS rendering failed
-POLITE_DELAY = 1.5      # seconds between requests
+POLITE_DELAY = 1.5      # seconds between request starts, per concurrent slot
+CONCURRENCY = 4         # pages fetched in parallel (at most CONCURRENCY / POLITE_DELAY req/s overall)
 
 
 # ─── HTML → Markdown extraction ───────────────────────────────────────────────
 
+# Semantic containers are tried in order; the first match wins.
+_MAIN_SELECTORS = (
+    "article",
+    "main",
+    "[role='main']",
+    "div.prose",
+    "div[class*='article']",
+    "div[class*='content']",
+    "div[class*='wiki']",
+    "div[class*='page']",
+)
+_NAV_SELECTOR = "nav, aside, [role='navigation'], [class*='sidebar']"
+_BODY_NOISE_SELECTOR = "nav, header, footer, aside, script, style"
+
+
 def _make_converter() -> html2text.HTML2Text:
     h = html2text.HTML2Text()
     h.ignore_links = False
@@ -101,126 +118,189 @@ def _make_converter() -> html2text.HTML2Text:
     return h
 
 
-_converter = _make_converter()
+def _replay(node: LexborNode, h: html2text.HTML2Text) -> None:
+    for child in node.iter(include_text=True):
+        if child.is_text_node:
+            h.handle_data(child.text_content)
+        elif child.is_element_node:
+            h.handle_starttag(child.tag, list(child.attributes.items()))
+            _replay(child, h)
+            h.handle_endtag(child.tag)
+        # comments are dropped
+
+
+def _to_markdown(el: LexborNode) -> str:
+    """Convert an already-parsed element to Markdown.
 
+    html2text is an HTMLParser subclass, so instead of serializing the subtree
+    and letting html2text parse it all over again, we replay the lexbor tree
+    into its start/data/end callbacks. A fresh converter is used per call
+    because pages are extracted on several threads at once.
+    """
+    h = _make_converter()
+    h.handle_starttag(el.tag, [])
+    _replay(el, h)
+    h.handle_endtag(el.tag)
+    return h.handle("").strip()
 
-def _find_main_content(soup: BeautifulSoup) -> str:
+
+def _find_main_content(tree: LexborHTMLParser) -> str:
     """Extract the main article content from the page HTML."""
     # Try semantic containers first
-    for selector in (
-        "article",
-        "main",
-        "[role='main']",
-        "div.prose",
-        "div[class*='article']",
-        "div[class*='content']",
-        "div[class*='wiki']",
-        "div[class*='page']",
-    ):
-        el = soup.select_one(selector)
+    for selector in _MAIN_SELECTORS:
+        el = tree.css_first(selector)
         if el:
             # Remove navigation sidebars embedded inside main
-            for nav in el.select("nav, aside, [role='navigation'], [class*='sidebar']"):
+            for nav in el.css(_NAV_SELECTOR):
                 nav.decompose()
-            return _converter.handle(str(el)).strip()
+            return _to_markdown(el)
 
     # Last resort: full body minus nav/header/footer
-    body = soup.find("body")
+    body = tree.body
     if body:
-        for tag in body.select("nav, header, footer, aside, script, style"):
+        for tag in body.css(_BODY_NOISE_SELECTOR):
             tag.decompose()
-        return _converter.handle(str(body)).strip()
+        return _to_markdown(body)
 
     return ""
 
 
-def _extract_title(soup: BeautifulSoup) -> str:
-    h1 = soup.find("h1")
+def _extract_title(tree: LexborHTMLParser) -> str:
+    h1 = tree.css_first("h1")
     if h1:
-        return h1.get_text(strip=True)
-    title = soup.find("title")
+        return h1.text(strip=True)
+    title = tree.css_first("title")
     if title:
-        return title.get_text(strip=True).split("|")[0].strip()
+        return title.text(strip=True).split("|")[0].strip()
     return ""
 
 
+def _extract(html: str) -> tuple[str, str]:
+    """Parse a page once and return (title, content)."""
+    tree = LexborHTMLParser(html)
+    return _extract_title(tree), _find_main_content(tree)
+
+
 # ─── Fetching strategies ──────────────────────────────────────────────────────
 
+class TokenBucket:
+    """Space request starts `1 / rate` seconds apart.
+
+    Unlike a fixed sleep after every request, only the time still owed is
+    waited out, so a slow page doesn't also pay the full polite delay.
+    Slots are reserved before awaiting, so concurrent callers never share one.
+    """
+
+    def __init__(self, rate: float):
+        self.interval = 1 / rate
+        self.next = time.monotonic()
+
+    async def acquire(self) -> None:
+        now = time.monotonic()
+        slot = max(now, self.next)
+        self.next = slot + self.interval
+        await asyncio.sleep(slot - now)
+
+
 def fetch_with_requests(url: str) -> tuple[str, str]:
-    """Return (title, content) using requests + BeautifulSoup. May fail on SPA pages."""
+    """Return (title, content) using requests + selectolax. May fail on SPA pages."""
     resp = requests.get(url, headers=HEADERS, timeout=30)
     resp.raise_for_status()
-    soup = BeautifulSoup(resp.text, "html.parser")
-    return _extract_title(soup), _find_main_content(soup)
+    return _extract(resp.text)
 
 
-def fetch_with_playwright(url: str) -> tuple[str, str]:
-    """Return (title, content) using Playwright (headless Chromium). Handles JS rendering."""
-    from playwright.sync_api import sync_playwright
+async def fetch_with_playwright(browser, url: str) -> tuple[str, str]:
+    """Return (title, content) using a shared Playwright browser. Handles JS rendering.
 
-    with sync_playwright() as p:
-        browser = p.chromium.launch(headless=True)
-        page = browser.new_page()
-        page.goto(url, wait_until="networkidle", timeout=30_000)
+    Each call gets its own BrowserContext so concurrent pages stay isolated and
+    their renderer memory is released as soon as the page is done.
+    """
+    context = await browser.new_context()
+    try:
+        page = await context.new_page()
+        await page.goto(url, wait_until="networkidle", timeout=30_000)
         # Wait for main content to appear
         try:
-            page.wait_for_selector("article, main, h1", timeout=10_000)
+            await page.wait_for_selector("article, main, h1", timeout=10_000)
         except Exception:
             pass
-        html = page.content()
-        browser.close()
+        html = await page.content()
+    finally:
+        await context.close()
 
-    soup = BeautifulSoup(html, "html.parser")
-    return _extract_title(soup), _find_main_content(soup)
+    return _extract(html)
 
 
-# ─── Main logic ───────────────────────────────────────────────────────────────
+# ─── Seen-key index ───────────────────────────────────────────────────────────
+# Alongside the JSONL output we keep a `<output>.keys` sidecar with one
+# `repo<TAB>path` line per saved record, so resuming is a cheap line split
+# instead of JSON-parsing the whole (ever-growing) output file. The lines are
+# kept as-is in the in-memory set (no per-key tuples) to keep resume memory low.
 
-def load_existing_keys(path: Path) -> set:
-    keys = set()
-    if not path.exists():
-        return keys
-    with open(path) as f:
+def _keys_path(output_path: Path) -> Path:
+    return output_path.with_suffix(output_path.suffix + ".keys")
+
+
+def _rebuild_keys_file(path: Path) -> None:
+    """One-time migration: derive the .keys sidecar from an existing JSONL output."""
+    print("  No key index found — building from saved data (one-time scan) ...")
+    with open(path, "rb") as f, open(_keys_path(path), "w") as keys_fp:
         for line in f:
             try:
-                d = json.loads(line)
-                keys.add((d["repo"], d["path"]))
-            except (json.JSONDecodeError, KeyError):
+                d = orjson.loads(line)
+                keys_fp.write(f"{d['repo']}\t{d['path']}\n")
+            except (orjson.JSONDecodeError, KeyError):
                 pass
+
+
+def load_existing_keys(path: Path) -> set[str]:
+    keys: set[str] = set()
+    keys_path = _keys_path(path)
+    if not path.exists():
+        # Output was removed for a full refresh — the sidecar is stale too
+        keys_path.unlink(missing_ok=True)
+        return keys
+    if not keys_path.exists():
+        _rebuild_keys_file(path)
+    with open(keys_path) as f:
+        keys.update(line.rstrip("\n") for line in f)
     return keys
 
 
-def fetch_all(output_path: Path, use_playwright: bool) -> None:
+# ─── Main logic ───────────────────────────────────────────────────────────────
+
+async def fetch_all_async(output_path: Path, use_playwright: bool) -> None:
     existing = load_existing_keys(output_path)
-    total = sum(len(pages) for pages in PAGES.values())
-    done = 0
-
-    with open(output_path, "a") as fout:
-        for repo, slugs in PAGES.items():
-            for slug in slugs:
-                done += 1
-                key = (repo, slug)
-                if key in existing:
-                    print(f"  [{done}/{total}] Skip (cached): {repo}/{slug}")
-                    continue
-
-                url = f"{BASE_URL}/{repo}/{slug}"
+    all_pairs = [(repo, slug) for repo, slugs in PAGES.items() for slug in slugs]
+    total = len(all_pairs)
+    sem = asyncio.Semaphore(CONCURRENCY)
+    bucket = TokenBucket(CONCURRENCY / POLITE_DELAY)
+
+    with open(output_path, "ab") as fout, open(_keys_path(output_path), "a") as keys_fp:
+
+        async def worker(done: int, repo: str, slug: str, browser) -> None:
+            key = f"{repo}\t{slug}"
+            if key in existing:
+                print(f"  [{done}/{total}] Skip (cached): {repo}/{slug}")
+                return
+
+            url = f"{BASE_URL}/{repo}/{slug}"
+            async with sem:
+                await bucket.acquire()
                 print(f"  [{done}/{total}] Fetching: {url}")
 
                 try:
-                    if use_playwright:
-                        title, content = fetch_with_playwright(url)
+                    if browser is not None:
+                        title, content = await fetch_with_playwright(browser, url)
                     else:
-                        title, content = fetch_with_requests(url)
+                        title, content = await asyncio.to_thread(fetch_with_requests, url)
 
                     if len(content) < MIN_CONTENT_LEN:
                         print(
                             f"    WARNING: content too short ({len(content)} chars). "
                             "Page may need JS rendering. Try --playwright."
                         )
-                        if not use_playwright:
-                            # Still save what we got, can re-fetch later
-                            pass
+                        # Still save what we got, can re-fetch later
 
                     record = {
                         "repo": repo,
@@ -228,13 +308,34 @@ def fetch_all(output_path: Path, use_playwright: bool) -> None:
                         "title": title,
                         "content": content,
                     }
-                    fout.write(json.dumps(record) + "\n")
+                    # No await between these writes, so records from
+                    # concurrent workers never interleave.
+                    fout.write(orjson.dumps(record) + b"\n")
                     fout.flush()
+                    keys_fp.write(key + "\n")
+                    keys_fp.flush()
 
                 except Exception as e:
                     print(f"    ERROR fetching {url}: {e}")
 
-                time.sleep(POLITE_DELAY)
+        async def run(browser=None) -> None:
+            await asyncio.gather(*(
+                worker(i, repo, slug, browser)
+                for i, (repo, slug) in enumerate(all_pairs, 1)
+            ))
+
+        if use_playwright:
+            from playwright.async_api import async_playwright
+
+            # One Chromium for the whole run; pages get their own contexts
+            async with async_playwright() as pw:
+                browser = await pw.chromium.launch(headless=True)
+                try:
+                    await run(browser)
+                finally:
+                    await browser.close()
+        else:
+            await run()
 
     print(f"\nOutput: {output_path.resolve()}")
 
@@ -262,7 +363,7 @@ def main():
             print("  pip install playwright && playwright install chromium")
             raise SystemExit(1)
 
-    fetch_all(output_path, args.playwright)
+    asyncio.run(fetch_all_async(output_path, args.playwright))
 
 
 if __name__ == "__main__":
@@ -1,8 +1,11 @@
 """
 fetch_docs.py — Download Markdown documentation from Linkerd GitHub repos.
 
-Uses the GitHub Git Trees API to list all .md files recursively, then
-fetches only the ones inside doc-relevant directories.
+Walks only the doc-relevant directories through the GitHub contents API to
+list their .md files, instead of downloading the whole recursive git tree.
+With a token, blob contents are fetched up to 100 at a time through the
+GraphQL API (the REST blobs endpoint is the fallback, and the only option
+without a token).
 
 Usage:
     export GITHUB_TOKEN=ghp_...
@@ -10,20 +13,32 @@ Usage:
     python fetch_docs.py --output data/raw_docs.jsonl
 
 Output: JSONL file, one doc per line:
-    {"repo": "linkerd/linkerd2", "path": "doc/...", "content": "..."}
+    {"repo": "linkerd/linkerd2", "path": "doc/...", "sha": "<blob sha>", "content": "..."}
+A file whose blob is already saved under another path gets a record without
+"content"; its text is in the earlier record with the same "sha".
 """
 
 import argparse
+import atexit
 import base64
 import json
 import os
+import threading
 import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from itertools import chain
 from pathlib import Path
+from urllib.parse import quote
 
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 DEFAULT_REPOS = ["linkerd/linkerd2", "linkerd/linkerd2-proxy"]
 GITHUB_API = "https://api.github.com"
+GRAPHQL_URL = f"{GITHUB_API}/graphql"
 
 # Only include markdown files under these path prefixes (case-insensitive)
 INCLUDE_PREFIXES = (
@@ -47,6 +62,36 @@ EXCLUDE_SUBSTRINGS = (
 )
 
 MAX_FILE_BYTES = 200_000  # skip very large files (auto-generated, etc.)
+MAX_RETRIES = 6           # attempts per request on connection errors / 429 / 5xx
+RATE_LIMIT_PACE = 0.1     # below this share of the hourly budget, spread the rest until reset
+BLOB_WORKERS = 8          # concurrent blob downloads (kept below the session pool size)
+GRAPHQL_BATCH = 100       # blobs requested per GraphQL query
+WRITE_BUFFER = 1 << 20    # output buffer size; files are flushed once per blob batch
+
+
+# ─── HTTP session ─────────────────────────────────────────────────────────────
+# One pooled keep-alive session for every GitHub call, so we pay the TCP+TLS
+# handshake once per run instead of once per request. Transient 429/5xx
+# responses are retried by urllib3 with jittered exponential backoff, honoring
+# Retry-After. POST is included because the GraphQL blob queries are read-only.
+
+def _make_session() -> requests.Session:
+    session = requests.Session()
+    retry = Retry(
+        total=MAX_RETRIES,
+        backoff_factor=1,
+        backoff_jitter=1.0,
+        allowed_methods=frozenset({"GET", "HEAD", "POST"}),
+        status_forcelist=(429, 500, 502, 503, 504),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    session.mount("https://", HTTPAdapter(pool_connections=16, pool_maxsize=16, max_retries=retry))
+    return session
+
+
+SESSION = _make_session()
+atexit.register(SESSION.close)
 
 
 def build_headers(token: str | None) -> dict:
@@ -59,51 +104,101 @@ def build_headers(token: str | None) -> dict:
     return h
 
 
-def wait_for_rate_limit(response: requests.Response) -> None:
-    remaining = int(response.headers.get("X-RateLimit-Remaining", 10))
-    if remaining < 5:
-        reset_ts = int(response.headers.get("X-RateLimit-Reset", time.time() + 60))
-        wait = max(reset_ts - time.time() + 2, 0)
-        print(f"    [rate limit] {remaining} requests left — sleeping {wait:.0f}s")
-        time.sleep(wait)
-
-
-def get_default_branch(repo: str, headers: dict) -> str:
-    resp = requests.get(f"{GITHUB_API}/repos/{repo}", headers=headers, timeout=30)
-    resp.raise_for_status()
-    return resp.json().get("default_branch", "main")
+# Blob downloads run on worker threads; only one of them should sleep out a
+# rate-limit window while the rest queue up behind it.
+_rate_limit_lock = threading.Lock()
 
 
-def list_markdown_files(repo: str, branch: str, headers: dict) -> list[dict]:
-    """Return list of {path, sha, size} for all .md files in the repo tree."""
-    url = f"{GITHUB_API}/repos/{repo}/git/trees/{branch}?recursive=1"
-    resp = requests.get(url, headers=headers, timeout=60)
+def wait_for_rate_limit(response: requests.Response) -> None:
+    """Same pacing as fetch_issues.py: sleep out a spent window, and spread the
+    last RATE_LIMIT_PACE of the budget evenly over the time until reset."""
+    headers = response.headers
+    if "X-RateLimit-Remaining" not in headers:
+        return
+    remaining = int(headers["X-RateLimit-Remaining"])
+    limit = int(headers.get("X-RateLimit-Limit", 0))
+    reset_ts = int(headers.get("X-RateLimit-Reset", time.time() + 60))
+    if remaining < 5:
+        with _rate_limit_lock:
+            # Re-check after acquiring: another worker may have already slept it out
+            wait = max(reset_ts - time.time() + 2, 0)
+            if wait > 2:
+                print(f"    [rate limit] {remaining} requests left — sleeping {wait:.0f}s")
+                time.sleep(wait)
+    elif remaining < limit * RATE_LIMIT_PACE:
+        time.sleep(max(reset_ts - time.time(), 0) / remaining)
+
+
+def get_default_branch(repo: str, session: requests.Session, etags: dict) -> str:
+    cached = etags.get(repo)
+    headers = {"If-None-Match": cached["etag"]} if cached else {}
+    resp = session.get(f"{GITHUB_API}/repos/{repo}", headers=headers, timeout=30)
+    if resp.status_code == 304:
+        return cached["branch"]
     resp.raise_for_status()
-    wait_for_rate_limit(resp)
+    branch = resp.json().get("default_branch", "main")
+    if "ETag" in resp.headers:
+        etags[repo] = {"etag": resp.headers["ETag"], "branch": branch}
+    return branch
+
+
+def _is_included(path: str) -> bool:
+    """Whether a path falls under one of INCLUDE_PREFIXES (case-insensitive)."""
+    path_lower = path.lower()
+    return any(path_lower.startswith(pfx.lower()) for pfx in INCLUDE_PREFIXES)
+
+
+def _list_directory(
+    repo: str, path: str, branch: str, session: requests.Session, etag: str | None = None
+) -> requests.Response:
+    url = f"{GITHUB_API}/repos/{repo}/contents/{quote(path)}".rstrip("/")
+    headers = {"If-None-Match": etag} if etag else {}
+    resp = session.get(url, params={"ref": branch}, headers=headers, timeout=30)
+    if resp.status_code != 304:
+        resp.raise_for_status()
+        wait_for_rate_limit(resp)
+    return resp
+
+
+def list_markdown_files(
+    repo: str, branch: str, session: requests.Session, etag: str | None = None
+) -> tuple[list[dict], str | None]:
+    """Return ({path, sha, size} for all relevant .md files, root listing ETag).
+
+    Rather than downloading the whole recursive git tree, only the top-level
+    entries matching INCLUDE_PREFIXES are walked (breadth-first) through the
+    contents API. A directory listing carries the tree sha of each subdirectory,
+    so the root listing changes whenever anything below it does; with `etag`
+    set the root request is conditional, and a 304 returns an empty list.
+    """
+    resp = _list_directory(repo, "", branch, session, etag)
+    if resp.status_code == 304:
+        return [], etag
+    root_etag = resp.headers.get("ETag")
 
-    tree = resp.json().get("tree", [])
     results = []
-    for item in tree:
-        if item.get("type") != "blob":
-            continue
-        path: str = item["path"]
-        if not path.lower().endswith(".md"):
-            continue
-        if any(excl in path for excl in EXCLUDE_SUBSTRINGS):
-            continue
-        path_lower = path.lower()
-        # Accept if path starts with one of our include prefixes OR is a top-level README/CHANGELOG
-        if any(
-            path_lower.startswith(pfx.lower()) or path_lower == pfx.lower() + ".md"
-            for pfx in INCLUDE_PREFIXES
-        ):
-            results.append({"path": path, "sha": item["sha"], "size": item.get("size", 0)})
-    return results
-
-
-def fetch_blob_content(repo: str, sha: str, headers: dict) -> str | None:
+    entries = resp.json()
+    pending_dirs: deque[str] = deque()
+    while True:
+        for item in entries:
+            path: str = item["path"]
+            if "/" not in path and not _is_included(path):
+                continue
+            if item["type"] == "dir":
+                if not any(excl in path + "/" for excl in EXCLUDE_SUBSTRINGS):
+                    pending_dirs.append(path)
+            elif item["type"] == "file" and path.lower().endswith(".md"):
+                if not any(excl in path for excl in EXCLUDE_SUBSTRINGS):
+                    results.append({"path": path, "sha": item["sha"], "size": item.get("size", 0)})
+        if not pending_dirs:
+            break
+        entries = _list_directory(repo, pending_dirs.popleft(), branch, session).json()
+    return results, root_etag
+
+
+def fetch_blob_content(repo: str, sha: str, session: requests.Session) -> str | None:
     url = f"{GITHUB_API}/repos/{repo}/git/blobs/{sha}"
-    resp = requests.get(url, headers=headers, timeout=30)
+    resp = session.get(url, timeout=30)
     resp.raise_for_status()
     wait_for_rate_limit(resp)
     blob = resp.json()
@@ -114,51 +209,210 @@ def fetch_blob_content(repo: str, sha: str, headers: dict) -> str | None:
     return content
 
 
-def load_existing_keys(path: Path) -> set:
-    keys = set()
-    if not path.exists():
-        return keys
-    with open(path) as f:
+# ─── Seen-key index ───────────────────────────────────────────────────────────
+# Alongside the JSONL output we keep a `<output>.keys` sidecar with one
+# `repo<TAB>path` line per saved record, so resuming is a cheap line split
+# instead of JSON-parsing the whole (ever-growing) output file. The lines are
+# kept as-is in the in-memory set (no per-key tuples) to keep resume memory low.
+
+def _keys_path(output_path: Path) -> Path:
+    return output_path.with_suffix(output_path.suffix + ".keys")
+
+
+def _rebuild_keys_file(path: Path) -> None:
+    """One-time migration: derive the .keys sidecar from an existing JSONL output."""
+    print("  No key index found — building from saved data (one-time scan) ...")
+    with open(path, "rb") as f, open(_keys_path(path), "w") as keys_fp:
+        for line in f:
+            try:
+                d = orjson.loads(line)
+                keys_fp.write(f"{d['repo']}\t{d['path']}\n")
+            except (orjson.JSONDecodeError, KeyError):
+                pass
+
+
+# `<output>.shas` lists, one per line, the blob shas whose content is already
+# in the output, so identical files elsewhere are recorded by reference
+# without downloading or re-reading them.
+
+def _shas_path(output_path: Path) -> Path:
+    return output_path.with_suffix(output_path.suffix + ".shas")
+
+
+def _rebuild_shas_file(path: Path) -> None:
+    """One-time migration: derive the .shas sidecar from an existing JSONL output."""
+    print("  No blob index found — building from saved data (one-time scan) ...")
+    with open(path, "rb") as f, open(_shas_path(path), "w") as shas_fp:
         for line in f:
             try:
-                d = json.loads(line)
-                keys.add((d["repo"], d["path"]))
-            except (json.JSONDecodeError, KeyError):
+                d = orjson.loads(line)
+                if d.get("sha") and d.get("content"):
+                    shas_fp.write(f"{d['sha']}\n")
+            except orjson.JSONDecodeError:
                 pass
+
+
+def load_saved_shas(path: Path) -> set[str]:
+    shas_path = _shas_path(path)
+    if not path.exists():
+        # Output was removed for a full refresh — the sidecar is stale too
+        shas_path.unlink(missing_ok=True)
+        return set()
+    if not shas_path.exists():
+        _rebuild_shas_file(path)
+    with open(shas_path) as f:
+        return {line.rstrip("\n") for line in f}
+
+
+# ─── ETag cache ───────────────────────────────────────────────────────────────
+# `.etags.json` next to the output remembers the ETag of each repo's metadata
+# and of each `repo@branch` root listing. Re-runs send them as If-None-Match; a
+# 304 has no body and does not count against the rate limit, so an unchanged
+# repo costs two empty round-trips instead of walking its doc directories.
+
+def _etags_path(output_path: Path) -> Path:
+    return output_path.parent / ".etags.json"
+
+
+def _load_etags(output_path: Path) -> dict:
+    etags_path = _etags_path(output_path)
+    if not output_path.exists():
+        # Output was removed for a full refresh — cached ETags would skip everything
+        etags_path.unlink(missing_ok=True)
+        return {}
+    try:
+        return json.loads(etags_path.read_text())
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def _save_etags(output_path: Path, etags: dict) -> None:
+    _etags_path(output_path).write_text(json.dumps(etags, indent=2))
+
+
+def fetch_blobs_graphql(repo: str, shas: list[str], session: requests.Session) -> dict[str, str | None]:
+    """Fetch many blobs in a single GraphQL query. Returns {sha: text}; text is None if unavailable."""
+    owner, name = repo.split("/", 1)
+    fields = "\n".join(
+        f'    b{i}: object(oid: "{sha}") {{ ... on Blob {{ text }} }}'
+        for i, sha in enumerate(shas)
+    )
+    query = f'query {{\n  repository(owner: "{owner}", name: "{name}") {{\n{fields}\n  }}\n}}'
+    resp = session.post(GRAPHQL_URL, json={"query": query}, timeout=60)
+    resp.raise_for_status()
+    wait_for_rate_limit(resp)
+    payload = resp.json()
+    if not payload.get("data"):
+        raise ValueError(f"GraphQL error: {payload.get('errors')}")
+    repository = payload["data"].get("repository") or {}
+    return {sha: (repository.get(f"b{i}") or {}).get("text") for i, sha in enumerate(shas)}
+
+
+def fetch_blob_batch(repo: str, shas: list[str], session: requests.Session) -> dict[str, str | None]:
+    """Fetch blobs via GraphQL when authenticated, falling back to REST per blob."""
+    texts: dict[str, str | None] = {}
+    if "Authorization" in session.headers:  # the GraphQL API requires a token
+        try:
+            texts = fetch_blobs_graphql(repo, shas, session)
+        except (requests.exceptions.RequestException, ValueError) as e:
+            print(f"    GraphQL batch failed, falling back to REST: {e}")
+    for sha in shas:
+        if texts.get(sha) is None:
+            texts[sha] = fetch_blob_content(repo, sha, session)
+    return texts
+
+
+def load_existing_keys(path: Path) -> set[str]:
+    keys: set[str] = set()
+    keys_path = _keys_path(path)
+    if not path.exists():
+        # Output was removed for a full refresh — the sidecar is stale too
+        keys_path.unlink(missing_ok=True)
+        return keys
+    if not keys_path.exists():
+        _rebuild_keys_file(path)
+    with open(keys_path) as f:
+        keys.update(line.rstrip("\n") for line in f)
     return keys
 
 
-def fetch_repo_docs(repo: str, headers: dict, output_path: Path) -> int:
+def fetch_repo_docs(repo: str, session: requests.Session, output_path: Path) -> int:
     existing = load_existing_keys(output_path)
+    saved_shas = load_saved_shas(output_path)
+    etags = _load_etags(output_path)
 
-    branch = get_default_branch(repo, headers)
+    branch = get_default_branch(repo, session, etags)
     print(f"  Default branch: {branch}")
 
-    files = list_markdown_files(repo, branch, headers)
-    print(f"  Found {len(files)} relevant markdown files")
+    tree_key = f"{repo}@{branch}"
+    files, tree_etag = list_markdown_files(repo, branch, session, etags.get(tree_key))
+    if tree_etag and tree_etag == etags.get(tree_key):
+        print("  Docs unchanged since last run (304)")
+    else:
+        print(f"  Found {len(files)} relevant markdown files")
+
+    # Filter before submitting so no worker is spent on known or oversized files
+    pending = []
+    for item in files:
+        if f"{repo}\t{item['path']}" in existing:
+            continue
+        if item["size"] > MAX_FILE_BYTES:
+            print(f"  Skipping {item['path']} (too large: {item['size']} bytes)")
+            continue
+        pending.append(item)
+
+    # Identical files share a blob sha — download each sha once
+    by_sha: dict[str, list[dict]] = {}
+    for item in pending:
+        by_sha.setdefault(item["sha"], []).append(item)
+
+    # ... and across repos: blobs already saved (this run or a previous one)
+    # are recorded by reference instead of downloaded again
+    reused = [sha for sha in by_sha if sha in saved_shas]
+    if reused:
+        print(f"  Reusing {len(reused)} blobs already saved from other repos")
+    shas = [sha for sha in by_sha if sha not in saved_shas]
+    batch_size = GRAPHQL_BATCH if "Authorization" in session.headers else 1
+    batches = [shas[i:i + batch_size] for i in range(0, len(shas), batch_size)]
 
     count = 0
-    with open(output_path, "a") as f:
-        for item in files:
-            key = (repo, item["path"])
-            if key in existing:
-                continue
-            if item["size"] > MAX_FILE_BYTES:
-                print(f"  Skipping {item['path']} (too large: {item['size']} bytes)")
-                continue
-
-            content = fetch_blob_content(repo, item["sha"], headers)
-            if not content or len(content.strip()) < 100:
-                continue
-
-            record = {
-                "repo": repo,
-                "path": item["path"],
-                "content": content.strip(),
-            }
-            f.write(json.dumps(record) + "\n")
+    with (
+        open(output_path, "ab", buffering=WRITE_BUFFER) as f,
+        open(_keys_path(output_path), "a", buffering=WRITE_BUFFER) as keys_fp,
+        open(_shas_path(output_path), "a", buffering=WRITE_BUFFER) as shas_fp,
+        ThreadPoolExecutor(max_workers=BLOB_WORKERS) as pool,
+    ):
+        futures = [pool.submit(fetch_blob_batch, repo, batch, session) for batch in batches]
+        # Workers only download; all writes happen here on the main thread.
+        # None marks a blob already saved, written by reference.
+        results = chain([dict.fromkeys(reused)], (future.result() for future in as_completed(futures)))
+        for texts in results:
+            for sha, content in texts.items():
+                if sha not in saved_shas:
+                    if not content or len(content.strip()) < 100:
+                        continue
+                    saved_shas.add(sha)
+                    shas_fp.write(f"{sha}\n")
+                for item in by_sha[sha]:
+                    record = {"repo": repo, "path": item["path"], "sha": sha}
+                    if content is not None:
+                        # The first file with this blob carries its text
+                        record["content"] = content.strip()
+                        content = None
+                    f.write(orjson.dumps(record) + b"\n")
+                    keys_fp.write(f"{repo}\t{item['path']}\n")
+                    count += 1
+            # Output before the indexes: a crash may re-fetch a saved doc,
+            # never skip one or point at a blob that wasn't written
             f.flush()
-            count += 1
+            keys_fp.flush()
+            shas_fp.flush()
+
+    # Only remember the tree once all of its files are saved, so an
+    # interrupted run isn't mistaken for a complete one next time.
+    if tree_etag:
+        etags[tree_key] = tree_etag
+    _save_etags(output_path, etags)
 
     return count
 
@@ -181,12 +435,12 @@ def main():
     output_path = Path(args.output)
     output_path.parent.mkdir(parents=True, exist_ok=True)
 
-    headers = build_headers(args.token)
+    SESSION.headers.update(build_headers(args.token))
     total = 0
 
     for repo in args.repos:
         print(f"\nFetching docs from {repo} ...")
-        n = fetch_repo_docs(repo, headers, output_path)
+        n = fetch_repo_docs(repo, SESSION, output_path)
         print(f"  Done: {n} new docs written")
         total += n
 
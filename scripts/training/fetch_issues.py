@@ -11,16 +11,28 @@ The script is resumable — already-fetched issues are skipped on re-run.
 """
 
 import argparse
+import asyncio
 import json
 import os
+import random
 import time
 from pathlib import Path
 
-import requests
+import aiohttp
+import orjson
 
 DEFAULT_REPOS = ["linkerd/linkerd2"]
 GITHUB_API = "https://api.github.com"
 
+# Comment threads of the issues on one page are fetched concurrently,
+# bounded so we stay well clear of GitHub's secondary rate limits.
+COMMENT_CONCURRENCY = 8
+CONNECTION_LIMIT = 16
+MAX_RETRIES = 6
+RATE_LIMIT_PACE = 0.1  # below this share of the hourly budget, spread the rest until reset
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+WRITE_BUFFER = 1 << 20  # output buffer size; files are flushed once per page
+
 
 def build_headers(token: str | None) -> dict:
     h = {
@@ -32,82 +44,169 @@ def build_headers(token: str | None) -> dict:
     return h
 
 
-def wait_for_rate_limit(response: requests.Response) -> None:
-    remaining = int(response.headers.get("X-RateLimit-Remaining", 10))
+async def wait_for_rate_limit(response: aiohttp.ClientResponse) -> None:
+    """Pace requests against the primary rate limit.
+
+    With the budget (nearly) spent, sleep until the window resets. Once less
+    than RATE_LIMIT_PACE of it is left, spread the remaining requests evenly
+    over the time until reset instead of spending them and then stalling.
+    Otherwise there is no wait at all.
+    """
+    headers = response.headers
+    if "X-RateLimit-Remaining" not in headers:
+        return
+    remaining = int(headers["X-RateLimit-Remaining"])
+    limit = int(headers.get("X-RateLimit-Limit", 0))
+    reset_ts = int(headers.get("X-RateLimit-Reset", time.time() + 60))
+    window = max(reset_ts - time.time(), 0)
     if remaining < 5:
-        reset_ts = int(response.headers.get("X-RateLimit-Reset", time.time() + 60))
-        wait = max(reset_ts - time.time() + 2, 0)
+        wait = window + 2
         print(f"    [rate limit] {remaining} requests left — sleeping {wait:.0f}s")
-        time.sleep(wait)
-
-
-def paginate(url: str, headers: dict, params: dict | None = None, max_retries: int = 6):
-    """Yield all items from a paginated GitHub API endpoint, with exponential backoff."""
+        await asyncio.sleep(wait)
+    elif remaining < limit * RATE_LIMIT_PACE:
+        await asyncio.sleep(window / remaining)
+
+
+async def _paginate(
+    session: aiohttp.ClientSession,
+    url: str,
+    params: dict | None = None,
+    max_retries: int = MAX_RETRIES,
+):
+    """Yield each page (a list of items) from a paginated GitHub API endpoint, with exponential backoff.
+
+    429/5xx responses (and 403s carrying Retry-After, i.e. GitHub's secondary
+    rate limit) are retried too. Retry-After is honored when present, and a
+    random jitter keeps concurrent comment fetches from retrying in lockstep.
+    """
     params = {**(params or {}), "per_page": 100}
     page = 1
     while True:
         params["page"] = page
         for attempt in range(max_retries):
             try:
-                resp = requests.get(url, headers=headers, params=params, timeout=30)
-                resp.raise_for_status()
-                wait_for_rate_limit(resp)
+                async with session.get(url, params=params) as resp:
+                    resp.raise_for_status()
+                    await wait_for_rate_limit(resp)
+                    data = await resp.json()
+                    has_next = "next" in resp.links
                 break
-            except (requests.exceptions.ConnectionError,
-                    requests.exceptions.Timeout) as e:
-                if attempt == max_retries - 1:
+            except (aiohttp.ClientConnectionError,
+                    aiohttp.ClientResponseError,
+                    asyncio.TimeoutError) as e:
+                retry_after = None
+                retryable = True
+                if isinstance(e, aiohttp.ClientResponseError):
+                    retry_after = (e.headers or {}).get("Retry-After")
+                    retryable = e.status in RETRY_STATUSES or (e.status == 403 and retry_after is not None)
+                if not retryable or attempt == max_retries - 1:
                     raise
-                wait = 2 ** attempt  # 1, 2, 4, 8, 16, 32 s
-                print(f"    Network error (attempt {attempt + 1}/{max_retries}), "
-                      f"retrying in {wait}s: {e}")
-                time.sleep(wait)
-        data = resp.json()
+                try:
+                    wait = float(retry_after)
+                except (TypeError, ValueError):
+                    wait = 2 ** attempt  # 1, 2, 4, 8, 16, 32 s
+                wait += random.uniform(0, 1)
+                print(f"    Request failed (attempt {attempt + 1}/{max_retries}), "
+                      f"retrying in {wait:.1f}s: {e!r}")
+                await asyncio.sleep(wait)
         if not data:
             break
-        yield from data
-        if "next" not in resp.links:
+        yield data
+        if not has_next:
             break
         page += 1
 
 
-def fetch_comments(repo: str, issue_number: int, headers: dict) -> list:
+async def fetch_comments(
+    session: aiohttp.ClientSession,
+    sem: asyncio.Semaphore,
+    repo: str,
+    issue_number: int,
+) -> list:
     url = f"{GITHUB_API}/repos/{repo}/issues/{issue_number}/comments"
-    try:
-        return list(paginate(url, headers))
-    except requests.exceptions.RequestException as e:
-        print(f"    Warning: could not fetch comments for #{issue_number}: {e}")
-        return []
+    comments: list = []
+    async with sem:
+        try:
+            async for page in _paginate(session, url):
+                comments.extend(page)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print(f"    Warning: could not fetch comments for #{issue_number}: {e!r}")
+            return []
+    return comments
 
 
-def load_existing_keys(path: Path) -> set:
-    """Return set of (repo, number) tuples already saved in the output file."""
-    keys = set()
-    if not path.exists():
-        return keys
-    with open(path) as f:
+# ─── Seen-key index ───────────────────────────────────────────────────────────
+# Alongside the JSONL output we keep a `<output>.keys` sidecar with one
+# `repo<TAB>number` line per saved record, so resuming is a cheap line split
+# instead of JSON-parsing the whole (ever-growing) output file. The lines are
+# kept as-is in the in-memory set (no per-key tuples) to keep resume memory low.
+
+def _keys_path(output_path: Path) -> Path:
+    return output_path.with_suffix(output_path.suffix + ".keys")
+
+
+def _rebuild_keys_file(path: Path) -> None:
+    """One-time migration: derive the .keys sidecar from an existing JSONL output."""
+    print("  No key index found — building from saved data (one-time scan) ...")
+    with open(path, "rb") as f, open(_keys_path(path), "w") as keys_fp:
         for line in f:
             try:
-                d = json.loads(line)
-                keys.add((d["repo"], d["number"]))
-            except (json.JSONDecodeError, KeyError):
+                d = orjson.loads(line)
+                keys_fp.write(f"{d['repo']}\t{d['number']}\n")
+            except (orjson.JSONDecodeError, KeyError):
                 pass
+
+
+def load_existing_keys(path: Path) -> set[str]:
+    """Return the set of "repo<TAB>number" keys already saved in the output file."""
+    keys: set[str] = set()
+    keys_path = _keys_path(path)
+    if not path.exists():
+        # Output was removed for a full refresh — the sidecar is stale too
+        keys_path.unlink(missing_ok=True)
+        return keys
+    if not keys_path.exists():
+        _rebuild_keys_file(path)
+    with open(keys_path) as f:
+        keys.update(line.rstrip("\n") for line in f)
     return keys
 
 
 # ─── Checkpoint helpers ───────────────────────────────────────────────────────
-# The checkpoint file stores the `created_at` of the last saved issue per repo.
-# On re-run we pass it as `since=` to the GitHub API so it skips already-fetched
-# pages server-side instead of paginating from page 1 every time.
+# The checkpoint file stores, per repo, the `created_at` of the last saved
+# issue and — once a run has paginated a repo to the end — the highest
+# `updated_at` seen during that run. On re-run we pass one of them as `since=`
+# to the GitHub API so it skips already-fetched pages server-side instead of
+# paginating from page 1 every time.
 #
-# Note: GitHub's `since` filters by `updated_at`, not `created_at`.  Using the
-# last `created_at` as the cutoff means we may re-fetch a few recently-updated
-# old issues, but those are already in `existing` and get skipped instantly.
+# GitHub's `since` filters by `updated_at`, not `created_at`. The `updated_at`
+# watermark is therefore the tighter cutoff: after a complete pass, anything
+# not yet saved must have been created or updated after it. It is only valid
+# for complete passes, though — an interrupted pass may leave older issues
+# unsaved — so until one finishes we fall back to the last `created_at`, which
+# may re-fetch a few recently-updated old issues; those are already in
+# `existing` and get skipped instantly.
 
 def _checkpoint_path(output_path: Path) -> Path:
     return output_path.parent / ".checkpoint.json"
 
 
+# Loaded once per run and kept in memory; `_save_checkpoint` only writes it back.
+_checkpoints_cache: dict[str, dict[str, str]] = {}
+_checkpoints_loaded = False
+
+
 def _load_checkpoints(output_path: Path) -> dict:
+    global _checkpoints_loaded
+    if not _checkpoints_loaded:
+        for repo, cp in _read_checkpoints(output_path).items():
+            # Older checkpoint files map repo -> created_at directly
+            _checkpoints_cache[repo] = {"created_at": cp} if isinstance(cp, str) else cp
+        _checkpoints_loaded = True
+    return _checkpoints_cache
+
+
+def _read_checkpoints(output_path: Path) -> dict:
     cp = _checkpoint_path(output_path)
     if cp.exists():
         try:
@@ -123,15 +222,15 @@ def _load_checkpoints(output_path: Path) -> dict:
 
     print("  No checkpoint found — building from saved data (one-time scan) ...")
     latest: dict[str, str] = {}
-    with open(output_path) as f:
+    with open(output_path, "rb") as f:
         for line in f:
             try:
-                d = json.loads(line)
+                d = orjson.loads(line)
                 repo = d["repo"]
                 ts = d.get("created_at", "")
                 if ts > latest.get(repo, ""):
                     latest[repo] = ts
-            except (json.JSONDecodeError, KeyError):
+            except (orjson.JSONDecodeError, KeyError):
                 pass
 
     if latest:
@@ -141,19 +240,24 @@ def _load_checkpoints(output_path: Path) -> dict:
     return latest
 
 
-def _save_checkpoint(output_path: Path, repo: str, created_at: str) -> None:
-    cp = _checkpoint_path(output_path)
+def _save_checkpoint(
+    output_path: Path, repo: str, created_at: str, updated_at: str | None = None
+) -> None:
     checkpoints = _load_checkpoints(output_path)
-    checkpoints[repo] = created_at
-    cp.write_text(json.dumps(checkpoints, indent=2))
+    cp = checkpoints.setdefault(repo, {})
+    cp["created_at"] = created_at
+    if updated_at:
+        cp["updated_at"] = updated_at
+    _checkpoint_path(output_path).write_text(json.dumps(checkpoints, indent=2))
 
 
 # ─────────────────────────────────────────────────────────────────────────────
 
-def fetch_repo_issues(repo: str, headers: dict, output_path: Path) -> int:
+async def fetch_repo_issues(repo: str, session: aiohttp.ClientSession, output_path: Path) -> int:
     existing = load_existing_keys(output_path)
-    checkpoints = _load_checkpoints(output_path)
-    since = checkpoints.get(repo)
+    checkpoint = _load_checkpoints(output_path).get(repo, {})
+    watermark = checkpoint.get("updated_at")
+    since = watermark or checkpoint.get("created_at")
 
     url = f"{GITHUB_API}/repos/{repo}/issues"
     params = {"state": "all", "sort": "created", "direction": "asc"}
@@ -161,56 +265,83 @@ def fetch_repo_issues(repo: str, headers: dict, output_path: Path) -> int:
         params["since"] = since
         print(f"  Resuming from checkpoint: {since}  (skipping already-fetched pages)")
 
-    last_created_at = since
+    last_created_at = checkpoint.get("created_at")
+    max_updated_at = watermark or ""
     count = 0
-
-    with open(output_path, "a") as f:
-        for issue in paginate(url, headers, params):
+    sem = asyncio.Semaphore(COMMENT_CONCURRENCY)
+
+    with (
+        open(output_path, "ab", buffering=WRITE_BUFFER) as f,
+        open(_keys_path(output_path), "a", buffering=WRITE_BUFFER) as keys_fp,
+    ):
+        # Issue pages are walked in order (GitHub pagination is sequential), but
+        # the comment threads of every new issue on a page are fetched together.
+        async for page in _paginate(session, url, params):
+            max_updated_at = max(max_updated_at, *(item["updated_at"] for item in page))
             # The issues endpoint also returns PRs — skip them
-            if issue.get("pull_request"):
-                continue
-
-            key = (repo, issue["number"])
-            if key in existing:
-                continue
-
-            comments = fetch_comments(repo, issue["number"], headers)
-
-            record = {
-                "repo": repo,
-                "number": issue["number"],
-                "title": issue["title"].strip(),
-                "body": (issue.get("body") or "").strip(),
-                "state": issue["state"],
-                "labels": [lb["name"] for lb in issue.get("labels", [])],
-                "author": issue["user"]["login"],
-                "created_at": issue["created_at"],
-                "closed_at": issue.get("closed_at"),
-                "comments": [
-                    {
-                        "author": c["user"]["login"],
-                        "body": (c["body"] or "").strip(),
-                        "created_at": c["created_at"],
-                    }
-                    for c in comments
-                ],
-            }
-            f.write(json.dumps(record) + "\n")
-            f.flush()
-            count += 1
-            last_created_at = issue["created_at"]
-
-            if count % 100 == 0:
-                # Save progress so a crash mid-run still preserves the position
+            issues = [
+                issue for issue in page
+                if not issue.get("pull_request") and f"{repo}\t{issue['number']}" not in existing
+            ]
+            all_comments = await asyncio.gather(
+                *(fetch_comments(session, sem, repo, issue["number"]) for issue in issues)
+            )
+
+            for issue, comments in zip(issues, all_comments):
+                record = {
+                    "repo": repo,
+                    "number": issue["number"],
+                    "title": issue["title"].strip(),
+                    "body": (issue.get("body") or "").strip(),
+                    "state": issue["state"],
+                    "labels": [lb["name"] for lb in issue.get("labels", [])],
+                    "author": issue["user"]["login"],
+                    "created_at": issue["created_at"],
+                    "updated_at": issue["updated_at"],
+                    "closed_at": issue.get("closed_at"),
+                    "comments": [
+                        {
+                            "author": c["user"]["login"],
+                            "body": (c["body"] or "").strip(),
+                            "created_at": c["created_at"],
+                        }
+                        for c in comments
+                    ],
+                }
+                f.write(orjson.dumps(record) + b"\n")
+                keys_fp.write(f"{repo}\t{issue['number']}\n")
+                count += 1
+                last_created_at = issue["created_at"]
+
+            if issues:
+                # Output before keys before checkpoint: a crash may re-fetch a
+                # saved issue, but the checkpoint never runs ahead of the data
+                f.flush()
+                keys_fp.flush()
                 _save_checkpoint(output_path, repo, last_created_at)
                 print(f"    {count} issues saved from {repo} ...")
 
+    # Pagination reached the end, so the watermark now covers the whole repo
     if last_created_at:
-        _save_checkpoint(output_path, repo, last_created_at)
+        _save_checkpoint(output_path, repo, last_created_at, max_updated_at)
 
     return count
 
 
+async def fetch_all(repos: list[str], headers: dict, output_path: Path) -> int:
+    """Fetch every repo over one shared aiohttp session; return total issues written."""
+    connector = aiohttp.TCPConnector(limit=CONNECTION_LIMIT)
+    timeout = aiohttp.ClientTimeout(total=30)
+    total = 0
+    async with aiohttp.ClientSession(headers=headers, connector=connector, timeout=timeout) as session:
+        for repo in repos:
+            print(f"\nFetching issues from {repo} ...")
+            n = await fetch_repo_issues(repo, session, output_path)
+            print(f"  Done: {n} new issues written")
+            total += n
+    return total
+
+
 def main():
     parser = argparse.ArgumentParser(
         description="Fetch Linkerd GitHub issues + comments for LLM fine-tuning"
@@ -238,14 +369,7 @@ def main():
     output_path = Path(args.output)
     output_path.parent.mkdir(parents=True, exist_ok=True)
 
-    headers = build_headers(args.token)
-    total = 0
-
-    for repo in args.repos:
-        print(f"\nFetching issues from {repo} ...")
-        n = fetch_repo_issues(repo, headers, output_path)
-        print(f"  Done: {n} new issues written")
-        total += n
+    total = asyncio.run(fetch_all(args.repos, build_headers(args.token), output_path))
 
     print(f"\nTotal new issues written: {total}")
     print(f"Output: {output_path.resolve()}")
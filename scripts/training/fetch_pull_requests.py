@@ -6,6 +6,10 @@ Complementary to fetch_issues.py. PRs provide:
 - Design discussions and trade-off analysis (review comment threads)
 - Accepted solutions to real problems (merged = approved by maintainers)
 
+With a token, PRs are listed through the GraphQL API together with their
+comments and review threads (one request per 50 PRs); without one, the REST
+API is used with per-PR comment requests.
+
 Filters applied:
 - Merged PRs only (closed-without-merge are excluded)
 - Skip bot authors (dependabot, github-actions, etc.)
@@ -26,16 +30,21 @@ The script is resumable — already-fetched PRs are skipped on re-run.
 """
 
 import argparse
+import asyncio
 import json
 import os
+import random
 import re
 import time
+from collections import deque
 from pathlib import Path
 
-import requests
+import httpx
+import orjson
 
 DEFAULT_REPOS = ["linkerd/linkerd2", "linkerd/linkerd2-proxy"]
 GITHUB_API = "https://api.github.com"
+GRAPHQL_URL = f"{GITHUB_API}/graphql"
 
 BOT_ACCOUNTS = frozenset({
     "dependabot[bot]",
@@ -49,28 +58,71 @@ BOT_ACCOUNTS = frozenset({
     "renovate[bot]",
 })
 
-# PRs whose titles match these patterns are noise — skip them
-NOISE_TITLE_PATTERNS = re.compile(
-    r"""
-    ^\s*(
-        bump\s               |   # "bump X from Y to Z"
-        update\s.*\sto\s     |   # "update foo to 1.2.3"
-        chore[:/]            |   # "chore: ..."
-        ci[:/]               |   # "ci: ..."
-        deps[:/]             |   # "deps: ..."
-        build[:/]            |   # "build: update ..."
-        fix\stypo            |   # "fix typo in ..."
-        typo                 |   # "typo: ..."
-        \[bot\]              |   # "[bot] something"
-        dependabot
-    )
-    """,
-    re.IGNORECASE | re.VERBOSE,
+# PRs whose (lowercased, left-stripped) titles start with one of these are
+# noise — skip them. str.startswith(tuple) does the whole check in C.
+NOISE_TITLE_PREFIXES = (
+    "bump ",                     # "bump X from Y to Z"
+    "chore:", "chore/",          # "chore: ..."
+    "ci:", "ci/",                # "ci: ..."
+    "deps:", "deps/",            # "deps: ..."
+    "build:", "build/",          # "build: update ..."
+    "fix typo",                  # "fix typo in ..."
+    "typo",                      # "typo: ..."
+    "[bot]",                     # "[bot] something"
+    "dependabot",
 )
+# The one non-prefix rule: "update foo to 1.2.3"
+NOISE_UPDATE_PATTERN = re.compile(r"update\s.*\sto\s")
 
 # Stop paginating when this many consecutive pages have all-known PRs
 EARLY_STOP_PAGES = 3
 
+# Comments and review threads of the PRs on one page are fetched concurrently,
+# bounded so we stay well clear of GitHub's secondary rate limits.
+DETAIL_CONCURRENCY = 8
+PAGE_CONCURRENCY = 8      # PR list pages fetched ahead of the consumer (REST path)
+CONNECTION_LIMIT = 16
+MAX_RETRIES = 6
+RATE_LIMIT_PACE = 0.1     # below this share of the hourly budget, spread the rest until reset
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+WRITE_BUFFER = 1 << 20    # output buffer size; the file is flushed once per page
+CHECKPOINT_EVERY = 25     # PRs written between checkpoint saves
+
+# With a token, PRs are listed through GraphQL together with their comments and
+# review threads, so a page of PRs is one request instead of 1 + 2 per PR.
+# Ordered by UPDATED_AT so a PR merged long after it was opened still lands
+# after the saved cursor. Nested connections are capped; the rare PR with more
+# comments or threads than fit is re-fetched over REST.
+GRAPHQL_PR_PAGE = 50
+PRS_QUERY = """
+query($owner: String!, $name: String!, $after: String) {
+  repository(owner: $owner, name: $name) {
+    pullRequests(states: MERGED, first: %d, after: $after,
+                 orderBy: {field: UPDATED_AT, direction: ASC}) {
+      pageInfo { endCursor hasNextPage }
+      nodes {
+        number title body mergedAt
+        author { login __typename }
+        labels(first: 20) { nodes { name } }
+        comments(first: 100) {
+          pageInfo { hasNextPage }
+          nodes { author { login __typename } body createdAt }
+        }
+        reviewThreads(first: 50) {
+          pageInfo { hasNextPage }
+          nodes {
+            comments(first: 20) {
+              pageInfo { hasNextPage }
+              nodes { author { login __typename } body createdAt }
+            }
+          }
+        }
+      }
+    }
+  }
+}
+""" % GRAPHQL_PR_PAGE
+
 
 # ─── HTTP helpers (same pattern as fetch_issues.py) ──────────────────────────
 
@@ -84,50 +136,171 @@ def build_headers(token: str | None) -> dict:
     return h
 
 
-def wait_for_rate_limit(response: requests.Response) -> None:
-    remaining = int(response.headers.get("X-RateLimit-Remaining", 10))
+async def wait_for_rate_limit(response: httpx.Response) -> None:
+    """Same pacing as fetch_issues.py: sleep out a spent window, and spread the
+    last RATE_LIMIT_PACE of the budget evenly over the time until reset."""
+    headers = response.headers
+    if "X-RateLimit-Remaining" not in headers:
+        return
+    remaining = int(headers["X-RateLimit-Remaining"])
+    limit = int(headers.get("X-RateLimit-Limit", 0))
+    reset_ts = int(headers.get("X-RateLimit-Reset", time.time() + 60))
+    window = max(reset_ts - time.time(), 0)
     if remaining < 5:
-        reset_ts = int(response.headers.get("X-RateLimit-Reset", time.time() + 60))
-        wait = max(reset_ts - time.time() + 2, 0)
+        wait = window + 2
         print(f"    [rate limit] {remaining} requests left — sleeping {wait:.0f}s")
-        time.sleep(wait)
+        await asyncio.sleep(wait)
+    elif remaining < limit * RATE_LIMIT_PACE:
+        await asyncio.sleep(window / remaining)
+
+
+async def _request(
+    client: httpx.AsyncClient,
+    method: str,
+    url: str,
+    max_retries: int = MAX_RETRIES,
+    **kwargs,
+) -> httpx.Response:
+    """Send a GitHub API request with exponential backoff.
+
+    429/5xx responses (and 403s carrying Retry-After, i.e. GitHub's secondary
+    rate limit) are retried too. Retry-After is honored when present, and a
+    random jitter keeps concurrent detail fetches from retrying in lockstep.
+    """
+    for attempt in range(max_retries):
+        try:
+            resp = await client.request(method, url, **kwargs)
+            resp.raise_for_status()
+            await wait_for_rate_limit(resp)
+            return resp
+        except (httpx.TransportError, httpx.HTTPStatusError) as e:
+            retry_after = None
+            retryable = True
+            if isinstance(e, httpx.HTTPStatusError):
+                status = e.response.status_code
+                retry_after = e.response.headers.get("Retry-After")
+                retryable = status in RETRY_STATUSES or (status == 403 and retry_after is not None)
+            if not retryable or attempt == max_retries - 1:
+                raise
+            try:
+                wait = float(retry_after)
+            except (TypeError, ValueError):
+                wait = 2 ** attempt  # 1, 2, 4, 8, 16, 32 s
+            wait += random.uniform(0, 1)
+            print(f"    Request failed (attempt {attempt + 1}/{max_retries}), "
+                  f"retrying in {wait:.1f}s: {e!r}")
+            await asyncio.sleep(wait)
 
 
-def paginate(url: str, headers: dict, params: dict | None = None, max_retries: int = 6):
-    """Yield all items from a paginated GitHub API endpoint, with exponential backoff."""
+async def _paginate(client: httpx.AsyncClient, url: str, params: dict | None = None, page: int = 1):
+    """Yield each page (a list of items) from a paginated GitHub API endpoint."""
     params = {**(params or {}), "per_page": 100}
-    page = 1
     while True:
         params["page"] = page
-        for attempt in range(max_retries):
-            try:
-                resp = requests.get(url, headers=headers, params=params, timeout=30)
-                resp.raise_for_status()
-                wait_for_rate_limit(resp)
-                break
-            except (requests.exceptions.ConnectionError,
-                    requests.exceptions.Timeout) as e:
-                if attempt == max_retries - 1:
-                    raise
-                wait = 2 ** attempt
-                print(f"    Network error (attempt {attempt + 1}/{max_retries}), "
-                      f"retrying in {wait}s: {e}")
-                time.sleep(wait)
+        resp = await _request(client, "GET", url, params=params)
         data = resp.json()
         if not data:
             break
-        yield from data
+        yield data
         if "next" not in resp.links:
             break
         page += 1
 
 
-def fetch_all_pages(url: str, headers: dict, params: dict | None = None) -> list:
+async def _paginate_parallel(
+    client: httpx.AsyncClient,
+    url: str,
+    params: dict | None = None,
+    workers: int = PAGE_CONCURRENCY,
+    first_page: int = 1,
+):
+    """Like _paginate, but fetch pages concurrently once the first page reveals the page count.
+
+    GitHub's `Link: rel="last"` on the first page gives the number of pages, so
+    the rest are requested up to `workers` ahead of the consumer and still
+    yielded in order. Only use this with a stable sort (e.g. created, asc), so
+    page boundaries don't move while the pages are in flight. Pages appended
+    after the first one was read are picked up by continuing serially at the end.
+    """
+    params = {**(params or {}), "per_page": 100}
+    resp = await _request(client, "GET", url, params={**params, "page": first_page})
+    data = resp.json()
+    if not data:
+        return
+    yield data
+    if "last" not in resp.links:
+        return
+    last_page = int(httpx.URL(resp.links["last"]["url"]).params.get("page", 1))
+
+    async def fetch(page: int) -> httpx.Response:
+        return await _request(client, "GET", url, params={**params, "page": page})
+
+    pending: deque[asyncio.Task] = deque()
+    next_page = first_page + 1
     try:
-        return list(paginate(url, headers, params))
-    except requests.exceptions.RequestException as e:
-        print(f"    Warning: failed to fetch {url}: {e}")
+        while next_page <= last_page or pending:
+            while next_page <= last_page and len(pending) < workers:
+                pending.append(asyncio.create_task(fetch(next_page)))
+                next_page += 1
+            resp = await pending.popleft()
+            data = resp.json()
+            if not data:
+                return
+            yield data
+    finally:
+        # The consumer stopped early (or a request failed) — drop prefetched pages
+        for task in pending:
+            task.cancel()
+
+    if "next" in resp.links:
+        async for data in _paginate(client, url, params, page=last_page + 1):
+            yield data
+
+
+async def _find_resume_page(
+    client: httpx.AsyncClient,
+    url: str,
+    params: dict,
+    after_number: int,
+) -> int:
+    """Binary-search the first page holding an item numbered above `after_number`.
+
+    Needs a listing sorted by created ascending (numbers only grow along it),
+    and costs O(log pages) requests instead of walking every known page.
+    Older PRs that were merged after the last run are not revisited; the
+    token (GraphQL) path, which orders by update time, picks those up.
+    """
+    params = {**params, "per_page": 100}
+
+    async def last_number(page: int) -> int:
+        resp = await _request(client, "GET", url, params={**params, "page": page})
+        data = resp.json()
+        return data[-1]["number"] if data else after_number + 1
+
+    resp = await _request(client, "GET", url, params={**params, "page": 1})
+    data = resp.json()
+    if not data or data[-1]["number"] > after_number or "last" not in resp.links:
+        return 1
+    lo = 2
+    hi = int(httpx.URL(resp.links["last"]["url"]).params.get("page", 1))
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if await last_number(mid) > after_number:
+            hi = mid
+        else:
+            lo = mid + 1
+    return lo
+
+
+async def fetch_all_pages(client: httpx.AsyncClient, url: str, params: dict | None = None) -> list:
+    items: list = []
+    try:
+        async for page in _paginate(client, url, params):
+            items.extend(page)
+    except httpx.HTTPError as e:
+        print(f"    Warning: failed to fetch {url}: {e!r}")
         return []
+    return items
 
 
 # ─── PR filtering ─────────────────────────────────────────────────────────────
@@ -137,33 +310,71 @@ def is_bot(author: str) -> bool:
 
 
 def is_noise_pr(pr: dict) -> bool:
-    """Return True for PRs that are unlikely to contain useful training signal."""
-    title = pr.get("title", "")
-    if NOISE_TITLE_PATTERNS.match(title):
+    """Return True for PRs that are unlikely to contain useful training signal.
+
+    Unmerged PRs (closed without merge) count as noise too. Checks run
+    cheapest first: the merged flag and bot set before any title work.
+    """
+    if not pr.get("merged_at"):
         return True
     if is_bot(pr["user"]["login"]):
         return True
+    title = pr.get("title", "").lstrip().lower()
+    if title.startswith(NOISE_TITLE_PREFIXES):
+        return True
+    if title.startswith("update") and NOISE_UPDATE_PATTERN.match(title):
+        return True
     return False
 
 
 # ─── Fetching PR sub-resources ────────────────────────────────────────────────
 
-def fetch_pr_comments(repo: str, pr_number: int, headers: dict) -> list:
+def _make_comment(author: str, body: str, c: dict) -> dict:
+    return {"author": author, "body": body, "created_at": c["created_at"]}
+
+
+def _clean_comments(raw: list) -> list:
+    """Keep non-bot general comments with some substance."""
+    result = []
+    for c in raw:
+        body = c.get("body")
+        # Length first: it's free, and most short comments never reach the bot check
+        if not body or len(body) < 20:
+            continue
+        author = c["user"]["login"]
+        if not is_bot(author):
+            result.append(_make_comment(author, body.strip(), c))
+    return result
+
+
+def _clean_threads(threads: list[list[dict]]) -> list[list[dict]]:
+    """Drop bot/trivial review comments, then keep threads worth training on."""
+    result = []
+    for thread in threads:
+        entries = []
+        for c in thread:
+            body = c.get("body")
+            body = body.strip() if body else ""
+            if len(body) < 30:
+                continue
+            author = c["user"]["login"]
+            if is_bot(author):
+                continue
+            entries.append(_make_comment(author, body, c))
+        # Only keep threads with at least 2 turns (discussion, not lone comment)
+        # Single-comment threads are still included if the comment is long enough
+        if len(entries) >= 2 or (len(entries) == 1 and len(entries[0]["body"]) >= 100):
+            result.append(entries)
+    return result
+
+
+async def fetch_pr_comments(client: httpx.AsyncClient, repo: str, pr_number: int) -> list:
     """Fetch general (issue-style) comments on a PR."""
     url = f"{GITHUB_API}/repos/{repo}/issues/{pr_number}/comments"
-    raw = fetch_all_pages(url, headers)
-    return [
-        {
-            "author": c["user"]["login"],
-            "body": (c["body"] or "").strip(),
-            "created_at": c["created_at"],
-        }
-        for c in raw
-        if not is_bot(c["user"]["login"]) and len((c.get("body") or "")) >= 20
-    ]
+    return _clean_comments(await fetch_all_pages(client, url))
 
 
-def fetch_review_threads(repo: str, pr_number: int, headers: dict) -> list[list[dict]]:
+async def fetch_review_threads(client: httpx.AsyncClient, repo: str, pr_number: int) -> list[list[dict]]:
     """
     Fetch inline review comments grouped into threads.
     GitHub review comments have an `in_reply_to_id` field that links replies
@@ -171,31 +382,96 @@ def fetch_review_threads(repo: str, pr_number: int, headers: dict) -> list[list[
     (author, body) pairs — useful for multi-turn training examples.
     """
     url = f"{GITHUB_API}/repos/{repo}/pulls/{pr_number}/comments"
-    raw = fetch_all_pages(url, headers)
+    raw = await fetch_all_pages(client, url)
 
     # Group by thread: top-level comments start new threads, replies extend them
     threads: dict[int, list[dict]] = {}   # root_id → [comment, ...]
     for c in raw:
-        if is_bot(c["user"]["login"]):
-            continue
-        body = (c.get("body") or "").strip()
-        if len(body) < 30:
-            continue
-        entry = {
-            "author": c["user"]["login"],
-            "body": body,
-            "created_at": c["created_at"],
-        }
         root_id = c.get("in_reply_to_id") or c["id"]
-        threads.setdefault(root_id, []).append(entry)
+        threads.setdefault(root_id, []).append(c)
+    return _clean_threads(list(threads.values()))
+
+
+async def fetch_pr_detail(
+    client: httpx.AsyncClient,
+    sem: asyncio.Semaphore,
+    repo: str,
+    pr_number: int,
+) -> tuple[list, list[list[dict]]]:
+    """Fetch a PR's comments and review threads together; return (comments, review_threads)."""
+    async with sem:
+        comments, review_threads = await asyncio.gather(
+            fetch_pr_comments(client, repo, pr_number),
+            fetch_review_threads(client, repo, pr_number),
+        )
+    return comments, review_threads
+
+
+# ─── GraphQL helpers ──────────────────────────────────────────────────────────
+# GraphQL nodes are reshaped into the REST field layout so the filters and the
+# record format are shared by both paths.
+
+def _login(actor: dict | None) -> str:
+    if not actor:
+        return "ghost"  # deleted account, as REST reports it
+    # REST reports GitHub App accounts as "name[bot]"; GraphQL drops the suffix
+    return actor["login"] + "[bot]" if actor["__typename"] == "Bot" else actor["login"]
+
+
+def _graphql_comment(node: dict) -> dict:
+    return {
+        "user": {"login": _login(node["author"])},
+        "body": node["body"],
+        "created_at": node["createdAt"],
+    }
+
+
+def _graphql_pr(node: dict) -> dict:
+    return {
+        "number": node["number"],
+        "title": node["title"],
+        "body": node["body"],
+        "merged_at": node["mergedAt"],
+        "user": {"login": _login(node["author"])},
+        "labels": node["labels"]["nodes"],
+    }
+
+
+def _graphql_detail(node: dict) -> tuple[list, list[list[dict]]] | None:
+    """Return (comments, review_threads) for a PR node, or None if any list was truncated."""
+    threads = node["reviewThreads"]
+    if (
+        node["comments"]["pageInfo"]["hasNextPage"]
+        or threads["pageInfo"]["hasNextPage"]
+        or any(t["comments"]["pageInfo"]["hasNextPage"] for t in threads["nodes"])
+    ):
+        return None
+    comments = _clean_comments([_graphql_comment(c) for c in node["comments"]["nodes"]])
+    review_threads = _clean_threads([
+        [_graphql_comment(c) for c in t["comments"]["nodes"]] for t in threads["nodes"]
+    ])
+    return comments, review_threads
 
-    # Only keep threads with at least 2 turns (discussion, not lone comment)
-    # Single-comment threads are still included if the comment is long enough
-    result = []
-    for thread in threads.values():
-        if len(thread) >= 2 or (len(thread) == 1 and len(thread[0]["body"]) >= 100):
-            result.append(thread)
-    return result
+
+def _cursor_path(output_path: Path) -> Path:
+    return output_path.parent / ".pr_cursor.json"
+
+
+def _load_cursors(output_path: Path) -> dict:
+    cursor_path = _cursor_path(output_path)
+    if not output_path.exists():
+        # Output was removed for a full refresh — start from the first page
+        cursor_path.unlink(missing_ok=True)
+        return {}
+    try:
+        return json.loads(cursor_path.read_text())
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def _save_cursor(output_path: Path, cursors: dict, repo: str, cursor: str) -> None:
+    cursors[repo] = cursor
+    _cursor_path(output_path).write_text(json.dumps(cursors, indent=2))
 
 
 # ─── Checkpoint helpers ───────────────────────────────────────────────────────
@@ -218,15 +494,15 @@ def _load_checkpoints(output_path: Path) -> dict:
 
     print("  No checkpoint found — bootstrapping from saved data (one-time scan) ...")
     max_number: dict[str, int] = {}
-    with open(output_path) as f:
+    with open(output_path, "rb") as f:
         for line in f:
             try:
-                d = json.loads(line)
+                d = orjson.loads(line)
                 repo = d["repo"]
                 n = d.get("number", 0)
                 if n > max_number.get(repo, 0):
                     max_number[repo] = n
-            except (json.JSONDecodeError, KeyError):
+            except (orjson.JSONDecodeError, KeyError):
                 pass
 
     if max_number:
@@ -235,101 +511,236 @@ def _load_checkpoints(output_path: Path) -> dict:
     return max_number
 
 
-def _save_checkpoint(output_path: Path, repo: str, pr_number: int) -> None:
-    cp = _checkpoint_path(output_path)
-    checkpoints = _load_checkpoints(output_path)
+def _save_checkpoint(output_path: Path, checkpoints: dict) -> None:
+    """Persist the in-memory checkpoints (loaded once per repo, updated per PR)."""
+    _checkpoint_path(output_path).write_text(json.dumps(checkpoints, indent=2))
+
+
+def _advance_checkpoint(checkpoints: dict, repo: str, pr_number: int) -> None:
     if pr_number > checkpoints.get(repo, 0):
         checkpoints[repo] = pr_number
-        cp.write_text(json.dumps(checkpoints, indent=2))
 
 
-# ─── Existing keys ────────────────────────────────────────────────────────────
+# ─── Seen-key index ───────────────────────────────────────────────────────────
+# Alongside the JSONL output we keep a `<output>.keys` sidecar with one
+# `repo<TAB>number` line per saved record, so resuming is a cheap line split
+# instead of JSON-parsing the whole (ever-growing) output file. The lines are
+# kept as-is in the in-memory set (no per-key tuples) to keep resume memory low.
 
-def load_existing_keys(path: Path) -> set:
-    keys = set()
-    if not path.exists():
-        return keys
-    with open(path) as f:
+def _keys_path(output_path: Path) -> Path:
+    return output_path.with_suffix(output_path.suffix + ".keys")
+
+
+def _rebuild_keys_file(path: Path) -> None:
+    """One-time migration: derive the .keys sidecar from an existing JSONL output."""
+    print("  No key index found — building from saved data (one-time scan) ...")
+    with open(path, "rb") as f, open(_keys_path(path), "w") as keys_fp:
         for line in f:
             try:
-                d = json.loads(line)
-                keys.add((d["repo"], d["number"]))
-            except (json.JSONDecodeError, KeyError):
+                d = orjson.loads(line)
+                keys_fp.write(f"{d['repo']}\t{d['number']}\n")
+            except (orjson.JSONDecodeError, KeyError):
                 pass
+
+
+def load_existing_keys(path: Path) -> set[str]:
+    """Return the set of "repo<TAB>number" keys already saved in the output file."""
+    keys: set[str] = set()
+    keys_path = _keys_path(path)
+    if not path.exists():
+        # Output was removed for a full refresh — the sidecar is stale too
+        keys_path.unlink(missing_ok=True)
+        return keys
+    if not keys_path.exists():
+        _rebuild_keys_file(path)
+    with open(keys_path) as f:
+        keys.update(line.rstrip("\n") for line in f)
     return keys
 
 
 # ─── Main fetch logic ─────────────────────────────────────────────────────────
 
-def fetch_repo_prs(repo: str, headers: dict, output_path: Path) -> int:
+def _issue_pr(issue: dict) -> dict:
+    """Shape a PR entry from the issues listing like a /pulls item.
+
+    The issues listing carries everything a record needs (number, title, body,
+    user, labels) without the heavy head/base repo objects; only `merged_at`
+    lives one level down, under `pull_request`.
+    """
+    issue["merged_at"] = issue["pull_request"].get("merged_at")
+    return issue
+
+
+def _pr_record(repo: str, pr: dict, comments: list, review_threads: list[list[dict]]) -> dict:
+    return {
+        "repo": repo,
+        "number": pr["number"],
+        "title": pr["title"].strip(),
+        "body": (pr.get("body") or "").strip(),
+        "merged_at": pr["merged_at"],
+        "author": pr["user"]["login"],
+        "labels": [lb["name"] for lb in pr.get("labels", [])],
+        "comments": comments,
+        "review_threads": review_threads,
+    }
+
+
+async def fetch_repo_prs_graphql(repo: str, client: httpx.AsyncClient, output_path: Path) -> int:
+    existing = load_existing_keys(output_path)
+    checkpoints = _load_checkpoints(output_path)
+    cursors = _load_cursors(output_path)
+    after = cursors.get(repo)
+    owner, name = repo.split("/", 1)
+
+    if after:
+        print("  Resuming after the last saved page (GraphQL cursor)")
+
+    count = 0
+    sem = asyncio.Semaphore(DETAIL_CONCURRENCY)
+
+    with (
+        open(output_path, "ab", buffering=WRITE_BUFFER) as f,
+        open(_keys_path(output_path), "a", buffering=WRITE_BUFFER) as keys_fp,
+    ):
+        try:
+            while True:
+                query = {"query": PRS_QUERY, "variables": {"owner": owner, "name": name, "after": after}}
+                resp = await _request(client, "POST", GRAPHQL_URL, json=query)
+                payload = resp.json()
+                if not payload.get("data"):
+                    raise RuntimeError(f"GraphQL error: {payload.get('errors')}")
+                conn = payload["data"]["repository"]["pullRequests"]
+
+                entries = []
+                for node in conn["nodes"]:
+                    pr = _graphql_pr(node)
+                    if is_noise_pr(pr) or f"{repo}\t{pr['number']}" in existing:
+                        continue
+                    entries.append((pr, _graphql_detail(node)))
+
+                truncated = [pr["number"] for pr, detail in entries if detail is None]
+                refetched = dict(zip(truncated, await asyncio.gather(
+                    *(fetch_pr_detail(client, sem, repo, number) for number in truncated)
+                )))
+
+                for pr, detail in entries:
+                    comments, review_threads = detail or refetched[pr["number"]]
+                    f.write(orjson.dumps(_pr_record(repo, pr, comments, review_threads)) + b"\n")
+                    existing.add(f"{repo}\t{pr['number']}")
+                    keys_fp.write(f"{repo}\t{pr['number']}\n")
+                    count += 1
+                    _advance_checkpoint(checkpoints, repo, pr["number"])
+                    if count % CHECKPOINT_EVERY == 0:
+                        f.flush()
+                        keys_fp.flush()
+                        _save_checkpoint(output_path, checkpoints)
+
+                    if count % 100 == 0:
+                        print(f"    {count} PRs saved from {repo} ...")
+
+                # The page is fully written — resume after it next time
+                f.flush()
+                keys_fp.flush()
+                if conn["pageInfo"]["endCursor"]:
+                    after = conn["pageInfo"]["endCursor"]
+                    _save_cursor(output_path, cursors, repo, after)
+                if not conn["pageInfo"]["hasNextPage"]:
+                    break
+        finally:
+            if count:
+                f.flush()
+                keys_fp.flush()
+                _save_checkpoint(output_path, checkpoints)
+
+    return count
+
+
+async def fetch_repo_prs(repo: str, client: httpx.AsyncClient, output_path: Path) -> int:
+    if "Authorization" in client.headers:  # the GraphQL API requires a token
+        return await fetch_repo_prs_graphql(repo, client, output_path)
+
     existing = load_existing_keys(output_path)
     checkpoints = _load_checkpoints(output_path)
     last_known_number = checkpoints.get(repo, 0)
 
-    url = f"{GITHUB_API}/repos/{repo}/pulls"
-    # Sort by created ascending so new PRs always appear at the end.
-    # We use early-stop logic (EARLY_STOP_PAGES) to skip pages we've already seen.
+    # List through the issues endpoint: its PR entries are a fraction of the
+    # size of /pulls items. Sort by created ascending so new PRs always appear
+    # at the end. On resume we binary-search to the first page past the
+    # checkpoint; early-stop logic (EARLY_STOP_PAGES) still ends the walk.
+    url = f"{GITHUB_API}/repos/{repo}/issues"
     params = {"state": "closed", "sort": "created", "direction": "asc"}
 
+    first_page = 1
     if last_known_number:
-        print(f"  Last saved PR: #{last_known_number} — will skip known pages")
+        first_page = await _find_resume_page(client, url, params, last_known_number)
+        print(f"  Last saved PR: #{last_known_number} — resuming at page {first_page}")
 
     count = 0
     consecutive_known_pages = 0
-    current_page_new = 0
-
-    with open(output_path, "a") as f:
-        for pr in paginate(url, headers, params):
-            # Track page boundaries (every 100 items)
-            is_page_boundary = (count + len(existing)) % 100 == 0 and count > 0
-            if is_page_boundary:
-                if current_page_new == 0:
-                    consecutive_known_pages += 1
-                else:
-                    consecutive_known_pages = 0
-                current_page_new = 0
-
-                if consecutive_known_pages >= EARLY_STOP_PAGES:
-                    print(f"    {EARLY_STOP_PAGES} consecutive pages of known PRs — stopping early")
-                    break
-
-            # Skip unmerged PRs (closed without merge)
-            if not pr.get("merged_at"):
-                continue
+    sem = asyncio.Semaphore(DETAIL_CONCURRENCY)
 
-            # Skip noise
-            if is_noise_pr(pr):
-                continue
-
-            key = (repo, pr["number"])
-            if key in existing:
-                continue
+    with (
+        open(output_path, "ab", buffering=WRITE_BUFFER) as f,
+        open(_keys_path(output_path), "a", buffering=WRITE_BUFFER) as keys_fp,
+    ):
+        try:
+            # PR pages are prefetched concurrently but consumed in order, and the
+            # comments and review threads of every new PR on a page are fetched
+            # together.
+            async for page in _paginate_parallel(client, url, params, first_page=first_page):
+                # The issues listing returns plain issues too — keep only PRs
+                prs = [_issue_pr(item) for item in page if "pull_request" in item]
+                prs = [
+                    pr for pr in prs
+                    # Skip noise (incl. unmerged PRs) and known PRs
+                    if not is_noise_pr(pr)
+                    and f"{repo}\t{pr['number']}" not in existing
+                ]
+
+                if count > 0:
+                    consecutive_known_pages = 0 if prs else consecutive_known_pages + 1
+                    if consecutive_known_pages >= EARLY_STOP_PAGES:
+                        print(f"    {EARLY_STOP_PAGES} consecutive pages of known PRs — stopping early")
+                        break
+
+                details = await asyncio.gather(
+                    *(fetch_pr_detail(client, sem, repo, pr["number"]) for pr in prs)
+                )
+
+                for pr, (comments, review_threads) in zip(prs, details):
+                    f.write(orjson.dumps(_pr_record(repo, pr, comments, review_threads)) + b"\n")
+                    keys_fp.write(f"{repo}\t{pr['number']}\n")
+                    count += 1
+                    _advance_checkpoint(checkpoints, repo, pr["number"])
+                    if count % CHECKPOINT_EVERY == 0:
+                        f.flush()
+                        keys_fp.flush()
+                        _save_checkpoint(output_path, checkpoints)
+
+                    if count % 100 == 0:
+                        print(f"    {count} PRs saved from {repo} ...")
+                f.flush()
+                keys_fp.flush()
+        finally:
+            if count:
+                f.flush()
+                keys_fp.flush()
+                _save_checkpoint(output_path, checkpoints)
 
-            # Fetch sub-resources
-            comments = fetch_pr_comments(repo, pr["number"], headers)
-            review_threads = fetch_review_threads(repo, pr["number"], headers)
-
-            record = {
-                "repo": repo,
-                "number": pr["number"],
-                "title": pr["title"].strip(),
-                "body": (pr.get("body") or "").strip(),
-                "merged_at": pr["merged_at"],
-                "author": pr["user"]["login"],
-                "labels": [lb["name"] for lb in pr.get("labels", [])],
-                "comments": comments,
-                "review_threads": review_threads,
-            }
-            f.write(json.dumps(record) + "\n")
-            f.flush()
-            count += 1
-            current_page_new += 1
-            _save_checkpoint(output_path, repo, pr["number"])
+    return count
 
-            if count % 100 == 0:
-                print(f"    {count} PRs saved from {repo} ...")
 
-    return count
+async def fetch_all(repos: list[str], headers: dict, output_path: Path) -> int:
+    """Fetch every repo over one shared HTTP/2 client; return total PRs written."""
+    limits = httpx.Limits(max_connections=CONNECTION_LIMIT, max_keepalive_connections=CONNECTION_LIMIT)
+    total = 0
+    async with httpx.AsyncClient(headers=headers, http2=True, limits=limits, timeout=30) as client:
+        for repo in repos:
+            print(f"\nFetching merged PRs from {repo} ...")
+            n = await fetch_repo_prs(repo, client, output_path)
+            print(f"  Done: {n} new PRs written")
+            total += n
+    return total
 
 
 # ─── Entry point ──────────────────────────────────────────────────────────────
@@ -361,14 +772,7 @@ def main():
     output_path = Path(args.output)
     output_path.parent.mkdir(parents=True, exist_ok=True)
 
-    headers = build_headers(args.token)
-    total = 0
-
-    for repo in args.repos:
-        print(f"\nFetching merged PRs from {repo} ...")
-        n = fetch_repo_prs(repo, headers, output_path)
-        print(f"  Done: {n} new PRs written")
-        total += n
+    total = asyncio.run(fetch_all(args.repos, build_headers(args.token), output_path))
 
     print(f"\nTotal new PRs written: {total}")
     print(f"Output: {output_path.resolve()}")
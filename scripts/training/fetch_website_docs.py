@@ -21,15 +21,24 @@ Usage:
 """
 
 import argparse
+import atexit
 import json
+import multiprocessing
+import os
+import re
+import threading
 import time
-import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from io import BytesIO
 from pathlib import Path
 from urllib.parse import urlparse
 
-import html2text
+import orjson
 import requests
-from bs4 import BeautifulSoup
+import requests_cache
+from lxml import etree
+from requests.adapters import HTTPAdapter
+from selectolax.lexbor import LexborHTMLParser, LexborNode
 
 # ─── Site configuration ───────────────────────────────────────────────────────
 
@@ -68,27 +77,62 @@ HEADERS = {
     "Accept-Language": "en-US,en;q=0.9",
 }
 
-POLITE_DELAY = 0.8        # seconds between page fetches
+POLITE_DELAY = 0.8        # average seconds between page fetch starts, per host
+PAGE_WORKERS = 4          # page fetches in flight per host (sites run in parallel)
+EXTRACT_WORKERS = min(os.cpu_count() or 1, 8)  # processes converting HTML → Markdown
 MIN_CONTENT_LEN = 200     # skip pages with very little extracted text
 MAX_RETRIES = 4
 
+HTTP_CACHE_NAME = ".http_cache.sqlite"  # kept next to the --output file
+PAGE_CACHE_TTL = 86400    # seconds before a cached page is revalidated
+SITEMAP_CACHE_TTL = 3600  # sitemaps change more often than the pages they list
+
+
+# ─── HTTP session ─────────────────────────────────────────────────────────────
+# One pooled keep-alive session for sitemaps and pages, so each host costs one
+# TCP+TLS handshake per run instead of one per request. Retries stay in
+# _fetch_text, so the adapter itself doesn't retry.
+#
+# Responses are kept in an on-disk SQLite cache. Fresh entries are served
+# without touching the network; stale ones are revalidated with
+# If-None-Match / If-Modified-Since, so an unchanged page costs a bodyless 304.
+#
+# Built in main() rather than at import: the cache lives next to the output
+# file, and extractor processes that re-import this module must not open it.
+
+def _make_session(cache_path: Path) -> requests.Session:
+    session = requests_cache.CachedSession(
+        str(cache_path),
+        expire_after=PAGE_CACHE_TTL,
+        urls_expire_after={"*/sitemap*.xml": SITEMAP_CACHE_TTL},
+        cache_control=True,
+    )
+    session.headers.update(HEADERS)
+    adapter = HTTPAdapter(pool_connections=16, pool_maxsize=32, max_retries=0)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+SESSION: requests.Session | None = None
+
 
 # ─── Sitemap parsing ──────────────────────────────────────────────────────────
 
-# XML namespaces used by sitemaps
-_NS = {
-    "sm":  "http://www.sitemaps.org/schemas/sitemap/0.9",
-    "xsi": "http://www.w3.org/2001/XMLSchema-instance",
-}
+# Sitemap entries (<url> in a urlset, <sitemap> in an index), with and without
+# the standard namespace
+_SM = "{http://www.sitemaps.org/schemas/sitemap/0.9}"
+_ENTRY_TAGS = (f"{_SM}url", f"{_SM}sitemap", "url", "sitemap")
+_LOC_TAGS = (f"{_SM}loc", "loc")
 
 
-def _fetch_text(url: str, timeout: int = 20) -> str | None:
-    """GET a URL with retries, return text or None on failure."""
+def _fetch(url: str, timeout: int = 20) -> requests.Response | None:
+    """GET a URL with retries, return the response or None on failure."""
     for attempt in range(MAX_RETRIES):
         try:
-            resp = requests.get(url, headers=HEADERS, timeout=timeout)
+            resp = SESSION.get(url, timeout=timeout)
             resp.raise_for_status()
-            return resp.text
+            return resp
         except (requests.exceptions.ConnectionError,
                 requests.exceptions.Timeout) as e:
             if attempt == MAX_RETRIES - 1:
@@ -96,85 +140,187 @@ def _fetch_text(url: str, timeout: int = 20) -> str | None:
                 return None
             time.sleep(2 ** attempt)
         except requests.exceptions.HTTPError as e:
+            # A throttling server says how long to back off; wait exactly that
+            retry_after = e.response.headers.get("Retry-After")
+            if (e.response.status_code in (429, 503) and retry_after
+                    and retry_after.isdigit() and attempt < MAX_RETRIES - 1):
+                print(f"    Throttled on {url} — retrying in {retry_after}s")
+                time.sleep(int(retry_after))
+                continue
             print(f"    HTTP error fetching {url}: {e}")
             return None
     return None
 
 
+def _fetch_text(url: str, timeout: int = 20) -> str | None:
+    """GET a URL with retries, return text or None on failure."""
+    resp = _fetch(url, timeout)
+    return resp.text if resp is not None else None
+
+
 def _parse_sitemap(url: str) -> list[str]:
     """
     Recursively parse a sitemap or sitemap-index and return all <loc> URLs.
     Handles both <urlset> (regular) and <sitemapindex> (index) formats.
+
+    Entries are streamed with lxml's iterparse and discarded as soon as their
+    <loc> is read, so memory stays flat however large the sitemap is.
     """
-    text = _fetch_text(url)
-    if not text:
+    resp = _fetch(url)
+    if resp is None:
         return []
 
+    urls = []
+    child_sitemaps = []
     try:
-        root = ET.fromstring(text)
-    except ET.ParseError as e:
+        # Raw bytes, so libxml2 honors the document's own encoding declaration
+        for _, entry in etree.iterparse(
+            BytesIO(resp.content), events=("end",), tag=_ENTRY_TAGS, resolve_entities=False
+        ):
+            loc_el = next(entry.iterchildren(*_LOC_TAGS), None)
+            if loc_el is not None and loc_el.text:
+                is_index = etree.QName(entry).localname == "sitemap"
+                # Index entries point to child sitemaps — recurse after this one
+                (child_sitemaps if is_index else urls).append(loc_el.text.strip())
+            entry.clear()
+            while entry.getprevious() is not None:
+                del entry.getparent()[0]
+    except etree.XMLSyntaxError as e:
         print(f"    XML parse error for {url}: {e}")
         return []
 
-    # Strip namespace for easier tag matching
-    tag = root.tag.split("}")[-1] if "}" in root.tag else root.tag
-
-    if tag == "sitemapindex":
-        # Index pointing to child sitemaps — recurse
-        urls = []
-        for sitemap_el in root.findall("sm:sitemap", _NS) or root.findall("sitemap"):
-            loc_el = sitemap_el.find("sm:loc", _NS)
-            if loc_el is None:
-                loc_el = sitemap_el.find("loc")
-            if loc_el is not None and loc_el.text:
-                urls.extend(_parse_sitemap(loc_el.text.strip()))
-        return urls
-    else:
-        # Regular urlset
-        urls = []
-        for url_el in root.findall("sm:url", _NS) or root.findall("url"):
-            loc_el = url_el.find("sm:loc", _NS)
-            if loc_el is None:
-                loc_el = url_el.find("loc")
-            if loc_el is not None and loc_el.text:
-                urls.append(loc_el.text.strip())
-        return urls
+    for child in child_sitemaps:
+        urls.extend(_parse_sitemap(child))
+    return urls
 
 
 def discover_urls(site_name: str, config: dict) -> list[str]:
     """Return all doc page URLs for a site, filtered by include/exclude prefixes."""
-    print(f"  Fetching sitemap: {config['sitemap']}")
+    print(f"  [{site_name}] Fetching sitemap: {config['sitemap']}")
     all_urls = _parse_sitemap(config["sitemap"])
-    print(f"  Total URLs in sitemap: {len(all_urls)}")
+    print(f"  [{site_name}] Total URLs in sitemap: {len(all_urls)}")
 
-    include = config.get("include_prefixes", ())
-    exclude = config.get("exclude_prefixes", ())
+    # str.startswith accepts a tuple and checks every prefix in C
+    include = tuple(config.get("include_prefixes", ()))
+    exclude = tuple(config.get("exclude_prefixes", ()))
 
     filtered = []
     for url in all_urls:
         path = urlparse(url).path
-        if include and not any(path.startswith(p) for p in include):
+        if include and not path.startswith(include):
             continue
-        if any(path.startswith(p) for p in exclude):
+        if path.startswith(exclude):
             continue
         filtered.append(url)
 
-    print(f"  After filtering: {len(filtered)} doc pages")
+    print(f"  [{site_name}] After filtering: {len(filtered)} doc pages")
     return filtered
 
 
 # ─── HTML → Markdown extraction ───────────────────────────────────────────────
 
-def _make_converter() -> html2text.HTML2Text:
-    h = html2text.HTML2Text()
-    h.ignore_links = False
-    h.ignore_images = True
-    h.body_width = 0
-    h.unicode_snob = True
-    return h
-
+# Docsy pages only use a small set of tags, so instead of running html2text
+# (pure Python, built for arbitrary HTML) we walk the lexbor tree and emit
+# Markdown for just those. Images are dropped, links kept, lines not wrapped.
+
+_HEADING_LEVELS = {"h1": 1, "h2": 2, "h3": 3, "h4": 4, "h5": 5, "h6": 6}
+_BLOCK_TAGS = frozenset({
+    "div", "section", "article", "main", "body", "header", "footer",
+    "details", "summary", "figure", "figcaption", "dl", "dt", "dd",
+})
+_SKIP_TAGS = frozenset({"img", "svg", "script", "style", "noscript", "template", "button", "input"})
+_WS_RE = re.compile(r"\s+")
+# Whitespace around paragraph breaks; code blocks are swapped out beforehand
+_BREAK_RE = re.compile(r"[ \t]*\n[ \t]*\n\s*")
+_CODE_TOKEN_RE = re.compile("\x00(\\d+)\x00")
+
+
+def _to_markdown(el: LexborNode) -> str:
+    """Convert an already-parsed element to Markdown."""
+    code_blocks: list[str] = []
+
+    def children(node: LexborNode) -> str:
+        return "".join(render(child) for child in node.iter(include_text=True))
+
+    def block(text: str) -> str:
+        return f"\n\n{text}\n\n" if text else ""
+
+    def wrap(node: LexborNode, marker: str) -> str:
+        inner = children(node).strip()
+        return f"{marker}{inner}{marker}" if inner else ""
+
+    def list_items(node: LexborNode) -> str:
+        ordered = node.tag == "ol"
+        lines = []
+        for i, li in enumerate((c for c in node.iter() if c.tag == "li"), 1):
+            marker = f"{i}. " if ordered else "- "
+            body = re.sub(r"\n{2,}", "\n", children(li).strip())
+            lines.append(marker + body.replace("\n", "\n" + " " * len(marker)))
+        return block("\n".join(lines))
+
+    def table(node: LexborNode) -> str:
+        rows = [
+            [children(cell).strip().replace("|", "\\|") for cell in row.iter() if cell.tag in ("th", "td")]
+            for row in node.css("tr")
+        ]
+        rows = [row for row in rows if row]
+        if not rows:
+            return ""
+        width = max(len(row) for row in rows)
+        lines = ["| " + " | ".join(row + [""] * (width - len(row))) + " |" for row in rows]
+        lines.insert(1, "|" + "---|" * width)
+        return block("\n".join(lines))
+
+    def pre(node: LexborNode) -> str:
+        code = node.css_first("code")
+        classes = ((code or node).attributes.get("class") or "").split()
+        lang = next((c[len("language-"):] for c in classes if c.startswith("language-")), "")
+        text = node.text(deep=True).strip("\n")
+        code_blocks.append(f"```{lang}\n{text}\n```")
+        return block(f"\x00{len(code_blocks) - 1}\x00")
+
+    def render(node: LexborNode) -> str:
+        if node.is_text_node:
+            return _WS_RE.sub(" ", node.text_content)
+        if not node.is_element_node:
+            return ""  # comments
+        tag = node.tag
+        if tag in _SKIP_TAGS:
+            return ""
+        if tag in _HEADING_LEVELS:
+            text = children(node).strip()
+            return block(f"{'#' * _HEADING_LEVELS[tag]} {text}") if text else ""
+        if tag == "p" or tag in _BLOCK_TAGS:
+            return block(children(node).strip())
+        if tag in ("ul", "ol"):
+            return list_items(node)
+        if tag == "pre":
+            return pre(node)
+        if tag == "table":
+            return table(node)
+        if tag == "blockquote":
+            inner = _BREAK_RE.sub("\n\n", children(node)).strip()
+            return block("\n".join(f"> {line}" if line else ">" for line in inner.split("\n")))
+        if tag == "br":
+            return "\n"
+        if tag == "hr":
+            return block("---")
+        if tag in ("strong", "b"):
+            return wrap(node, "**")
+        if tag in ("em", "i"):
+            return wrap(node, "_")
+        if tag == "code":
+            text = _WS_RE.sub(" ", node.text(deep=True)).strip()
+            return f"`{text}`" if text else ""
+        if tag == "a":
+            text = children(node).strip()
+            href = node.attributes.get("href")
+            return f"[{text}]({href})" if text and href else text
+        return children(node)
+
+    markdown = _BREAK_RE.sub("\n\n", render(el)).strip()
+    return _CODE_TOKEN_RE.sub(lambda m: code_blocks[int(m.group(1))], markdown)
 
-_converter = _make_converter()
 
 # Ordered list of CSS selectors to try for main content
 _CONTENT_SELECTORS = (
@@ -198,37 +344,39 @@ _REMOVE_SELECTORS = (
     "[class*='nav']", "[class*='menu']",
     "script", "style",
 )
+# One selector list, so noise is removed in a single tree traversal
+_REMOVE_SELECTOR = ", ".join(_REMOVE_SELECTORS)
 
 
 def extract_content(html: str) -> tuple[str, str]:
     """Return (title, markdown_content) from raw HTML."""
-    soup = BeautifulSoup(html, "html.parser")
+    tree = LexborHTMLParser(html)
 
     # Extract title
     title = ""
-    h1 = soup.find("h1")
+    h1 = tree.css_first("h1")
+    title_el = tree.css_first("title")
     if h1:
-        title = h1.get_text(strip=True)
-    elif soup.title:
-        title = soup.title.get_text(strip=True).split("|")[0].split("–")[0].strip()
+        title = h1.text(strip=True)
+    elif title_el:
+        title = title_el.text(strip=True).split("|")[0].split("–")[0].strip()
 
     # Find main content container
     content_el = None
     for selector in _CONTENT_SELECTORS:
-        content_el = soup.select_one(selector)
+        content_el = tree.css_first(selector)
         if content_el:
             break
     if not content_el:
-        content_el = soup.find("body")
+        content_el = tree.body
     if not content_el:
         return title, ""
 
     # Remove noise elements
-    for sel in _REMOVE_SELECTORS:
-        for el in content_el.select(sel):
-            el.decompose()
+    for el in content_el.css(_REMOVE_SELECTOR):
+        el.decompose()
 
-    markdown = _converter.handle(str(content_el)).strip()
+    markdown = _to_markdown(content_el)
     return title, markdown
 
 
@@ -271,13 +419,13 @@ def _load_done_urls(output_path: Path) -> set[str]:
     # Bootstrap from output file
     if output_path.exists():
         print("  No checkpoint — bootstrapping from saved data (one-time scan) ...")
-        with open(output_path) as f:
+        with open(output_path, "rb") as f:
             for line in f:
                 try:
-                    d = json.loads(line)
+                    d = orjson.loads(line)
                     if "url" in d:
                         done.add(d["url"])
-                except (json.JSONDecodeError, KeyError):
+                except (orjson.JSONDecodeError, KeyError):
                     pass
         _save_done_urls(output_path, done)
 
@@ -291,59 +439,115 @@ def _save_done_urls(output_path: Path, done: set[str]) -> None:
 
 # ─── Main fetch logic ─────────────────────────────────────────────────────────
 
+class TokenBucket:
+    """Space request starts `1 / rate` seconds apart.
+
+    Unlike a fixed sleep after every request, only the time still owed is
+    waited out, so a slow page doesn't also pay the full polite delay.
+    Slots are reserved under a lock, so concurrent threads never share one.
+    """
+
+    def __init__(self, rate: float):
+        self.interval = 1 / rate
+        self.next = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> None:
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next)
+            self.next = slot + self.interval
+        time.sleep(slot - now)
+
+
+def _fetch_page(
+    url: str,
+    use_playwright: bool,
+    bucket: TokenBucket,
+    extractors: ProcessPoolExecutor,
+) -> tuple[str, str] | None:
+    """Return (title, content) for one page, or None if it couldn't be fetched.
+
+    The Markdown walk is pure Python, so it runs in a worker process rather
+    than on this thread, where it would hold the GIL against every fetch.
+    """
+    bucket.acquire()
+    if use_playwright:
+        return fetch_with_playwright(url)
+    html = _fetch_text(url)
+    if not html:
+        return None
+    return extractors.submit(extract_content, html).result()
+
+
 def fetch_site(
     site_name: str,
-    config: dict,
+    urls: list[str],
     output_path: Path,
+    f,
+    lock: threading.Lock,
     use_playwright: bool,
     done_urls: set[str],
+    extractors: ProcessPoolExecutor,
 ) -> int:
-    urls = discover_urls(site_name, config)
+    """Fetch a site's pending pages PAGE_WORKERS at a time into the shared output.
+
+    Each site gets its own pool and token bucket, so the polite rate applies
+    per host. Writes to `f` and `done_urls` are serialized by `lock`.
+    """
     pending = [u for u in urls if u not in done_urls]
-    print(f"  {len(pending)} pages to fetch ({len(urls) - len(pending)} already done)")
+    print(f"  [{site_name}] {len(pending)} pages to fetch ({len(urls) - len(pending)} already done)")
 
     count = 0
-    with open(output_path, "a") as f:
-        for i, url in enumerate(pending, 1):
+    bucket = TokenBucket(1 / POLITE_DELAY)
+    # One browser per page already; don't also run several at once
+    workers = 1 if use_playwright else PAGE_WORKERS
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(_fetch_page, url, use_playwright, bucket, extractors): url
+            for url in pending
+        }
+        for i, future in enumerate(as_completed(futures), 1):
+            url = futures[future]
             try:
-                if use_playwright:
-                    title, content = fetch_with_playwright(url)
-                else:
-                    html = _fetch_text(url)
-                    if not html:
-                        continue
-                    title, content = extract_content(html)
-
-                if len(content) < MIN_CONTENT_LEN:
-                    print(f"    [{i}/{len(pending)}] Skip (thin content, {len(content)} chars): {url}")
-                    # Still mark as done so we don't retry indefinitely
+                result = future.result()
+            except Exception as e:
+                print(f"    Error on {url}: {e}")
+                continue
+            if result is None:
+                continue
+            title, content = result
+
+            if len(content) < MIN_CONTENT_LEN:
+                print(f"    [{i}/{len(pending)}] Skip (thin content, {len(content)} chars): {url}")
+                # Still mark as done so we don't retry indefinitely
+                with lock:
                     done_urls.add(url)
-                    continue
-
-                path = urlparse(url).path.rstrip("/")
-                record = {
-                    # Use "repo"/"path" keys for compatibility with doc_to_pairs()
-                    "repo": site_name,
-                    "path": path,
-                    "url": url,
-                    "title": title,
-                    "content": content,
-                }
-                f.write(json.dumps(record) + "\n")
-                f.flush()
+                continue
+
+            path = urlparse(url).path.rstrip("/")
+            record = {
+                # Use "repo"/"path" keys for compatibility with doc_to_pairs()
+                "repo": site_name,
+                "path": path,
+                "url": url,
+                "title": title,
+                "content": content,
+            }
+            with lock:
+                f.write(orjson.dumps(record) + b"\n")
                 done_urls.add(url)
                 count += 1
 
                 if count % 20 == 0:
+                    # Flush first so the checkpoint never lists an unwritten page
+                    f.flush()
                     _save_done_urls(output_path, done_urls)
                     print(f"    [{i}/{len(pending)}] {count} pages saved from {site_name}")
 
-            except Exception as e:
-                print(f"    Error on {url}: {e}")
-
-            time.sleep(POLITE_DELAY)
-
-    _save_done_urls(output_path, done_urls)
+    with lock:
+        f.flush()
+        _save_done_urls(output_path, done_urls)
     return count
 
 
@@ -378,15 +582,38 @@ def main():
     output_path = Path(args.output)
     output_path.parent.mkdir(parents=True, exist_ok=True)
 
+    global SESSION
+    SESSION = _make_session(output_path.parent / HTTP_CACHE_NAME)
+    atexit.register(SESSION.close)
+
     done_urls = _load_done_urls(output_path)
     total = 0
 
-    for site_name in args.sites:
-        config = SITES[site_name]
-        print(f"\nScraping {site_name} ...")
-        n = fetch_site(site_name, config, output_path, args.playwright, done_urls)
-        print(f"  Done: {n} new pages written")
-        total += n
+    # Distinct hosts don't share a polite delay, so sitemaps and then pages
+    # are fetched for all selected sites at once
+    with ThreadPoolExecutor(max_workers=len(args.sites)) as pool:
+        print(f"\nDiscovering pages on {', '.join(args.sites)} ...")
+        site_urls = list(pool.map(discover_urls, args.sites, (SITES[s] for s in args.sites)))
+
+        lock = threading.Lock()
+        with (
+            open(output_path, "ab") as f,
+            # spawn: workers start lazily from the fetch threads, and forking
+            # then could copy locks held by the HTTP cache or urllib3 pools
+            ProcessPoolExecutor(
+                max_workers=EXTRACT_WORKERS, mp_context=multiprocessing.get_context("spawn")
+            ) as extractors,
+        ):
+            print(f"\nScraping {', '.join(args.sites)} ...")
+            counts = pool.map(
+                lambda site_name, urls: fetch_site(
+                    site_name, urls, output_path, f, lock, args.playwright, done_urls, extractors
+                ),
+                args.sites, site_urls,
+            )
+            for site_name, n in zip(args.sites, counts):
+                print(f"  Done: {n} new pages written from {site_name}")
+                total += n
 
     print(f"\nTotal new pages written: {total}")
     print(f"Output: {output_path.resolve()}")
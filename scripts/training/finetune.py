@@ -8,7 +8,7 @@ Device support:
 
 Requirements:
     pip install torch transformers peft trl accelerate datasets
-    # CUDA only (optional, for 4-bit + adamw_8bit):
+    # CUDA only (optional, for 4-bit + paged_adamw_8bit):
     pip install bitsandbytes
 
 HuggingFace access:
@@ -23,10 +23,11 @@ Usage:
 """
 
 import argparse
+import hashlib
 import os
 
 import torch
-from datasets import load_dataset
+from datasets import load_dataset, load_from_disk
 from peft import LoraConfig, get_peft_model
 from transformers import (
     AutoModelForCausalLM,
@@ -72,19 +73,70 @@ def parse_args() -> argparse.Namespace:
 
 # ─── Data formatting ──────────────────────────────────────────────────────────
 
-def format_conversation(example: dict) -> dict:
-    """Convert ShareGPT format → single text string for SFT."""
-    text = ""
-    for turn in example.get("conversations", []):
-        role = turn.get("from", "")
-        value = turn.get("value", "")
-        if role == "system":
-            text += f"<|system|>\n{value}\n"
-        elif role == "human":
-            text += f"<|user|>\n{value}\n"
-        elif role == "gpt":
-            text += f"<|assistant|>\n{value}\n"
-    return {"text": text}
+# ShareGPT role → chat-template prefix; turns with other roles are dropped
+ROLE_PREFIXES = {
+    "system": "<|system|>\n",
+    "human": "<|user|>\n",
+    "gpt": "<|assistant|>\n",
+}
+
+
+def format_batch(examples: dict) -> dict:
+    """Convert a batch of ShareGPT conversations → single text strings for SFT."""
+    texts = []
+    for conversations in examples["conversations"]:
+        parts = []
+        for turn in conversations or ():
+            prefix = ROLE_PREFIXES.get(turn.get("from", ""))
+            if prefix is not None:
+                parts += (prefix, turn.get("value", ""), "\n")
+        texts.append("".join(parts))
+    return {"text": texts}
+
+
+def _tokenized_cache_dir(args: argparse.Namespace) -> str:
+    """Cache location keyed on everything the token ids depend on."""
+    st = os.stat(args.data)
+    key = f"{args.model}|{os.path.abspath(args.data)}|{st.st_size}|{st.st_mtime_ns}|{MAX_SEQ_LENGTH}"
+    return os.path.join(args.output, "tokenized_cache", hashlib.sha1(key.encode()).hexdigest()[:12])
+
+
+def load_training_dataset(args: argparse.Namespace, tokenizer):
+    """Format and tokenize the training data once, then reuse it from disk.
+
+    SFTTrainer skips its own tokenization for datasets that already carry
+    `input_ids`, so later runs on the same data and model start training
+    straight away.
+    """
+    cache_dir = _tokenized_cache_dir(args)
+    if os.path.isdir(cache_dir):
+        print(f"Using tokenized dataset cache: {cache_dir}")
+        return load_from_disk(cache_dir)
+
+    dataset = load_dataset("json", data_files=args.data, split="train")
+    dataset = dataset.map(
+        format_batch,
+        batched=True,
+        batch_size=1000,
+        writer_batch_size=1000,
+        num_proc=os.cpu_count(),
+        remove_columns=dataset.column_names,
+    )
+    eos = tokenizer.eos_token
+    dataset = dataset.map(
+        # EOS marks where one conversation ends once they are packed together
+        lambda batch: tokenizer(
+            [text + eos for text in batch["text"]],
+            truncation=True,
+            max_length=MAX_SEQ_LENGTH,
+        ),
+        batched=True,
+        batch_size=1000,
+        num_proc=os.cpu_count(),
+        remove_columns=["text"],
+    )
+    dataset.save_to_disk(cache_dir)
+    return dataset
 
 
 # ─── Main ─────────────────────────────────────────────────────────────────────
@@ -96,12 +148,21 @@ def main() -> None:
     print(f"Model  : {args.model}")
     print(f"Data   : {args.data}")
 
+    if device == "cuda":
+        # Let fp32 matmuls and convolutions (incl. the compiled kernels) use
+        # TF32 tensor cores on Ampere+; a no-op on older GPUs
+        torch.backends.cuda.matmul.allow_tf32 = True
+        torch.backends.cudnn.allow_tf32 = True
+
     # ── Load tokenizer ────────────────────────────────────────────────────────
     tokenizer = AutoTokenizer.from_pretrained(args.model)
     tokenizer.pad_token = tokenizer.eos_token
     tokenizer.padding_side = "right"
 
     # ── Load model ────────────────────────────────────────────────────────────
+    # Only the plain bf16 CUDA model is compiled: inductor graph-breaks on the
+    # bitsandbytes 4-bit ops, and MPS/CPU stay eager
+    compile_model = False
     if device == "cuda":
         try:
             from transformers import BitsAndBytesConfig
@@ -115,16 +176,22 @@ def main() -> None:
                 args.model,
                 quantization_config=bnb_config,
                 device_map="auto",
+                attn_implementation="sdpa",
             )
             print("Loaded in 4-bit (CUDA)")
+            # 8-bit optimizer states, paged to CPU on memory spikes (bitsandbytes)
+            optim = "paged_adamw_8bit"
         except ImportError:
             # bitsandbytes not installed — fall back to bf16
             model = AutoModelForCausalLM.from_pretrained(
                 args.model,
                 dtype=torch.bfloat16,
                 device_map="auto",
+                attn_implementation="sdpa",
             )
             print("Loaded in bf16 (CUDA, bitsandbytes not found)")
+            optim = "adamw_torch_fused"
+            compile_model = True
 
     elif device == "mps":
         # device_map is not supported with MPS; load then move
@@ -134,6 +201,9 @@ def main() -> None:
             dtype=torch.float16,
         )
         model = model.to("mps")
+        # Fused AdamW runs on MPS from PyTorch 2.4; older builds use the reference kernel
+        torch_release = tuple(int(x) for x in torch.__version__.split("+")[0].split(".")[:2])
+        optim = "adamw_torch_fused" if torch_release >= (2, 4) else "adamw_torch"
 
     else:
         print("Loading model in fp32 (CPU) — this will be very slow ...")
@@ -141,6 +211,13 @@ def main() -> None:
             args.model,
             dtype=torch.float32,
         )
+        optim = "adamw_torch"
+
+    if device == "cuda":
+        # Recompute activations in the backward pass instead of keeping them
+        # for every layer — the KV cache is useless while training anyway
+        model.config.use_cache = False
+        model.gradient_checkpointing_enable(gradient_checkpointing_kwargs={"use_reentrant": False})
 
     # ── LoRA adapter ──────────────────────────────────────────────────────────
     lora_config = LoraConfig(
@@ -158,8 +235,7 @@ def main() -> None:
     model.print_trainable_parameters()
 
     # ── Dataset ───────────────────────────────────────────────────────────────
-    dataset = load_dataset("json", data_files=args.data, split="train")
-    dataset = dataset.map(format_conversation, remove_columns=dataset.column_names)
+    dataset = load_training_dataset(args, tokenizer)
     print(f"Training examples: {len(dataset)}")
 
     # ── Training args ─────────────────────────────────────────────────────────
@@ -174,17 +250,30 @@ def main() -> None:
         gradient_accumulation_steps=grad_accum,
         warmup_steps=10,
         learning_rate=2e-4,
-        # Mixed precision — not supported on MPS, skip on CPU
+        # Mixed precision — not supported on MPS, skip on CPU. bf16 needs no
+        # loss scaling; the Trainer only adds a GradScaler on the fp16 path.
         fp16=(device == "cuda" and not torch.cuda.is_bf16_supported()),
         bf16=(device == "cuda" and torch.cuda.is_bf16_supported()),
         logging_steps=10,
         save_strategy="epoch",
-        # adamw_8bit requires bitsandbytes (CUDA only)
-        optim="adamw_8bit" if device == "cuda" else "adamw_torch",
+        optim=optim,
         dataloader_pin_memory=(device == "cuda"),
+        # Collate the next batches in background workers while the step runs
+        dataloader_num_workers=min(4, os.cpu_count() or 1),
+        dataloader_prefetch_factor=4,
+        dataloader_persistent_workers=True,
+        gradient_checkpointing=(device == "cuda"),
+        gradient_checkpointing_kwargs={"use_reentrant": False},
+        # Inductor fuses the LoRA-wrapped blocks into Triton kernels
+        torch_compile=compile_model,
         report_to="none",
         dataset_text_field="text",
         max_length=MAX_SEQ_LENGTH,
+        # No packing: with SDPA attention a packed block is one causal sequence,
+        # so each conversation would attend to the unrelated ones before it.
+        # Batching similar lengths together keeps the padding low instead.
+        packing=False,
+        group_by_length=True,
     )
 
     # ── Train ─────────────────────────────────────────────────────────────────
@@ -18,10 +18,17 @@ Usage:
 """
 
 import argparse
-import json
+import heapq
+import mmap
 import re
+import shutil
+from collections.abc import Iterator
+from concurrent.futures import ProcessPoolExecutor
+from itertools import tee, zip_longest
 from pathlib import Path
 
+import orjson
+
 # ─── Constants ────────────────────────────────────────────────────────────────
 
 SYSTEM_PROMPT = (
@@ -68,12 +75,23 @@ NOISE_PHRASES = (
     "/close",
     "/label",
 )
+_NOISE_RE = re.compile("|".join(map(re.escape, NOISE_PHRASES)))
+
+# Technical-content markers counted in one pass: inline CLI commands (exact
+# case) and problem/solution keywords (any case)
+_TECH_RE = re.compile(
+    r"(?P<cli>`(?:kubectl|linkerd|helm)\s)"
+    r"|(?P<kw>\b(?i:error|fix|solution|cause|because|resolved)\b)"
+)
 
 MIN_ISSUE_BODY = 80       # characters
 MIN_COMMENT_LEN = 80      # characters for a response
 MIN_RESPONSE_LEN = 120    # characters for final response
 MAX_PROMPT_LEN = 4000     # truncate very long issue bodies
 MAX_RESPONSE_LEN = 3000   # truncate very long comments
+TRUNCATION_MARK = "\n\n[...truncated]"
+
+WRITE_BATCH = 1 << 20     # serialized pairs are buffered up to this many bytes per write
 
 
 # ─── Text helpers ─────────────────────────────────────────────────────────────
@@ -87,9 +105,7 @@ def clean(text: str) -> str:
 
 
 def truncate(text: str, max_len: int) -> str:
-    if len(text) <= max_len:
-        return text
-    return text[:max_len] + "\n\n[...truncated]"
+    return text if len(text) <= max_len else text[:max_len] + TRUNCATION_MARK
 
 
 def is_bot(author: str) -> bool:
@@ -110,30 +126,28 @@ def score_comment(comment: dict) -> float:
     if len(body) < MIN_COMMENT_LEN:
         return 0.0
 
-    lower = body.lower()
-    if any(phrase in lower for phrase in NOISE_PHRASES):
+    if _NOISE_RE.search(body.lower()):
         return -1.0
 
     score = min(len(body) / 200, 8.0)  # length bonus, capped
 
     # Technical content bonuses
     score += body.count("```") * 0.8
-    score += len(re.findall(r"`(?:kubectl|linkerd|helm)\s", body)) * 1.5
-    score += len(re.findall(r"\b(error|fix|solution|cause|because|resolved)\b", lower)) * 0.3
+    for m in _TECH_RE.finditer(body):
+        score += 1.5 if m.lastgroup == "cli" else 0.3
 
     return score
 
 
 # ─── Issue → training pairs ───────────────────────────────────────────────────
 
-def issue_to_pairs(issue: dict) -> list[dict]:
-    pairs = []
+def issue_to_pairs(issue: dict) -> Iterator[dict]:
     title = issue["title"].strip()
     body = clean(issue.get("body") or "")
     comments = issue.get("comments", [])
 
     if len(title) < 10:
-        return pairs
+        return
 
     # Build the human prompt
     if len(body) >= MIN_ISSUE_BODY:
@@ -145,21 +159,23 @@ def issue_to_pairs(issue: dict) -> list[dict]:
     scored = [(score_comment(c), c) for c in comments]
     good = [(s, c) for s, c in scored if s > 1.0]
     if not good:
-        return pairs
-    good.sort(key=lambda x: x[0], reverse=True)
+        return
+    # Only the top 4 are ever used — select them without sorting the rest
+    good = heapq.nlargest(4, good, key=lambda x: x[0])
+    # Clean each of them once
+    top = [clean(c["body"]) for _, c in good]
 
     # --- Pair 1: best single response ---
-    best_score, best_comment = good[0]
-    response = truncate(clean(best_comment["body"]), MAX_RESPONSE_LEN)
+    response = truncate(top[0], MAX_RESPONSE_LEN)
     if len(response) >= MIN_RESPONSE_LEN:
-        pairs.append({
+        yield {
             "conversations": [
                 {"from": "system", "value": SYSTEM_PROMPT},
                 {"from": "human", "value": prompt},
                 {"from": "gpt",   "value": response},
             ],
             "source": f"{issue['repo']}#{issue['number']}",
-        })
+        }
 
     # --- Pair 2: multi-turn conversation (if ≥2 good human/bot turns) ---
     # Alternate human/gpt based on comment order; must end on gpt
@@ -168,54 +184,49 @@ def issue_to_pairs(issue: dict) -> list[dict]:
             {"from": "system", "value": SYSTEM_PROMPT},
             {"from": "human", "value": prompt},
         ]
-        for i, (_, c) in enumerate(good[:4]):
+        for i, cleaned in enumerate(top):
             role = "gpt" if i % 2 == 0 else "human"
-            turn_text = truncate(clean(c["body"]), MAX_RESPONSE_LEN)
+            turn_text = truncate(cleaned, MAX_RESPONSE_LEN)
             if len(turn_text) < MIN_COMMENT_LEN:
                 break
             turns.append({"from": role, "value": turn_text})
 
         if turns[-1]["from"] == "gpt":
-            pairs.append({
+            yield {
                 "conversations": turns,
                 "source": f"{issue['repo']}#{issue['number']}-mt",
-            })
-
-    return pairs
+            }
 
 
 # ─── Doc → training pairs ─────────────────────────────────────────────────────
 
-def _split_doc_sections(content: str) -> list[tuple[str, str]]:
+# H1/H2 headings
+_DOC_HEADING_RE = re.compile(r"^(#{1,2})\s+(.+)$", re.MULTILINE)
+
+
+def _split_doc_sections(content: str) -> Iterator[tuple[str, str]]:
     """
     Split a markdown doc into (heading, body) pairs.
-    Returns [] if the doc has no headings.
+    Yields nothing if the doc has no headings.
     """
-    # Match H1/H2 headings
-    pattern = re.compile(r"^(#{1,2})\s+(.+)$", re.MULTILINE)
-    matches = list(pattern.finditer(content))
-    if not matches:
-        return []
-
-    sections = []
-    for i, m in enumerate(matches):
-        start = m.end()
-        end = matches[i + 1].start() if i + 1 < len(matches) else len(content)
-        heading = m.group(2).strip()
-        body = content[start:end].strip()
+    # Walk the matches alongside their successors; a section ends where the
+    # next heading starts (or at the end of the doc for the last one)
+    matches, following = tee(_DOC_HEADING_RE.finditer(content))
+    next(following, None)
+    for m, nxt in zip_longest(matches, following):
+        end = nxt.start() if nxt is not None else len(content)
+        body = content[m.end():end].strip()
         if body:
-            sections.append((heading, body))
-    return sections
+            yield m.group(2).strip(), body
 
 
-def doc_to_pairs(doc: dict) -> list[dict]:
-    pairs = []
+def doc_to_pairs(doc: dict) -> Iterator[dict]:
     path: str = doc["path"]
     content = clean(doc.get("content") or "")
     repo = doc["repo"]
 
     if len(content) < 200:
-        return pairs
+        return
 
     # Strategy 1: treat the whole doc as a reference answer
     # Use the explicit title if available (DeepWiki records carry one), else derive from path
@@ -224,14 +235,14 @@ def doc_to_pairs(doc: dict) -> list[dict]:
     prompt = f"Explain the Linkerd documentation section: {filename}"
     response = truncate(content, MAX_RESPONSE_LEN)
     if len(response) >= MIN_RESPONSE_LEN:
-        pairs.append({
+        yield {
             "conversations": [
                 {"from": "system", "value": SYSTEM_PROMPT},
                 {"from": "human", "value": prompt},
                 {"from": "gpt",   "value": response},
             ],
             "source": f"{repo}/{path}",
-        })
+        }
 
     # Strategy 2: one pair per H1/H2 section
     for heading, body in _split_doc_sections(content):
@@ -239,16 +250,14 @@ def doc_to_pairs(doc: dict) -> list[dict]:
             continue
         section_prompt = f"Explain '{heading}' in the context of Linkerd."
         section_response = truncate(body, MAX_RESPONSE_LEN)
-        pairs.append({
+        yield {
             "conversations": [
                 {"from": "system", "value": SYSTEM_PROMPT},
                 {"from": "human", "value": section_prompt},
                 {"from": "gpt",   "value": section_response},
             ],
             "source": f"{repo}/{path}#{heading}",
-        })
-
-    return pairs
+        }
 
 
 # ─── PR → training pairs ──────────────────────────────────────────────────────
@@ -258,18 +267,17 @@ _REVIEW_NOISE = (
     "lgtm", "looks good", "approved", "nit:", "/approve", "/lgtm",
     "thanks!", "thank you", "ping", "ptal", "please take a look",
 )
+_REVIEW_NOISE_RE = re.compile("|".join(map(re.escape, _REVIEW_NOISE)))
 
 MIN_PR_BODY = 100        # minimum chars for a PR body to be useful
 MIN_REVIEW_BODY = 80     # minimum chars for a review comment to be useful
 
 
 def _is_review_noise(body: str) -> bool:
-    lower = body.lower().strip()
-    return any(lower.startswith(p) or lower == p for p in _REVIEW_NOISE) or len(body) < MIN_REVIEW_BODY
+    return len(body) < MIN_REVIEW_BODY or _REVIEW_NOISE_RE.match(body.lower().strip()) is not None
 
 
-def pr_to_pairs(pr: dict) -> list[dict]:
-    pairs = []
+def pr_to_pairs(pr: dict) -> Iterator[dict]:
     title = pr.get("title", "").strip()
     body = clean(pr.get("body") or "")
     comments = pr.get("comments", [])
@@ -278,7 +286,7 @@ def pr_to_pairs(pr: dict) -> list[dict]:
     source = f"{repo}#PR{pr['number']}"
 
     if not title:
-        return pairs
+        return
 
     # --- Pair 1: PR description as explanation ---
     # "What does PR X change and why?" → PR body
@@ -286,14 +294,14 @@ def pr_to_pairs(pr: dict) -> list[dict]:
         prompt = f"Explain the motivation and changes in this Linkerd pull request: {title}"
         response = truncate(body, MAX_RESPONSE_LEN)
         if len(response) >= MIN_RESPONSE_LEN:
-            pairs.append({
+            yield {
                 "conversations": [
                     {"from": "system", "value": SYSTEM_PROMPT},
                     {"from": "human", "value": prompt},
                     {"from": "gpt",   "value": response},
                 ],
                 "source": source,
-            })
+            }
 
     # --- Pair 2: general discussion comments ---
     good_comments = [
@@ -312,7 +320,7 @@ def pr_to_pairs(pr: dict) -> list[dict]:
             turns.append({"from": role, "value": text})
 
         if turns[-1]["from"] == "gpt":
-            pairs.append({"conversations": turns, "source": f"{source}-discussion"})
+            yield {"conversations": turns, "source": f"{source}-discussion"}
 
     # --- Pair 3: review threads (inline code review discussions) ---
     for i, thread in enumerate(review_threads):
@@ -330,26 +338,40 @@ def pr_to_pairs(pr: dict) -> list[dict]:
             turns.append({"from": role, "value": truncate(clean(c["body"]), MAX_RESPONSE_LEN)})
 
         if turns[-1]["from"] == "gpt":
-            pairs.append({"conversations": turns, "source": f"{source}-review{i}"})
-
-    return pairs
+            yield {"conversations": turns, "source": f"{source}-review{i}"}
 
 
 # ─── Main ─────────────────────────────────────────────────────────────────────
 
-def process_file(input_path: Path, converter, output_file) -> tuple[int, int]:
+def process_file(input_path: Path, converter, output_path: Path) -> tuple[int, int]:
     """Read a JSONL file, convert each record, write pairs. Returns (read, written)."""
+    if input_path.stat().st_size == 0:
+        # Empty files can't be mmapped — and have nothing to convert
+        output_path.write_bytes(b"")
+        return 0, 0
+
     read = written = 0
-    with open(input_path) as f:
-        for line in f:
+    buf = bytearray()
+    # Lines are sliced straight out of the mapped file as bytes for orjson
+    with (
+        open(input_path, "rb") as f,
+        mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm,
+        open(output_path, "wb") as output_file,
+    ):
+        for line in iter(mm.readline, b""):
             read += 1
             try:
-                record = json.loads(line)
-            except json.JSONDecodeError:
+                record = orjson.loads(line)
+            except orjson.JSONDecodeError:
                 continue
-            for pair in converter(record):
-                output_file.write(json.dumps(pair) + "\n")
-                written += 1
+            # Serialize a record's pairs in one comprehension, append them in one go
+            chunks = [orjson.dumps(pair, option=orjson.OPT_APPEND_NEWLINE) for pair in converter(record)]
+            buf += b"".join(chunks)
+            written += len(chunks)
+            if len(buf) > WRITE_BATCH:
+                output_file.write(buf)
+                buf.clear()
+        output_file.write(buf)
     return read, written
 
 
@@ -378,15 +400,32 @@ def main():
         ("Websites", Path(args.websites), doc_to_pairs),  # linkerd.io + docs.buoyant.io
     ]
 
-    with open(output_path, "w") as fout:
-        for label, path, converter in sources:
-            if path.exists():
-                r, w = process_file(path, converter, fout)
-                print(f"{label} — read: {r:>6}  pairs written: {w:>6}")
-                total_read += r
-                total_written += w
-            else:
-                print(f"{label} file not found: {path} — skipping")
+    # Sources are converted in parallel, each into its own shard next to the
+    # output; the shards are then concatenated in source order.
+    shards = []
+    try:
+        with ProcessPoolExecutor(max_workers=len(sources)) as pool:
+            for i, (label, path, converter) in enumerate(sources):
+                if path.exists():
+                    shard = output_path.with_name(f".{output_path.name}.{i}.part")
+                    shards.append((label, shard, pool.submit(process_file, path, converter, shard)))
+                else:
+                    print(f"{label} file not found: {path} — skipping")
+
+            with open(output_path, "wb") as fout:
+                for label, shard, future in shards:
+                    r, w = future.result()
+                    print(f"{label} — read: {r:>6}  pairs written: {w:>6}")
+                    total_read += r
+                    total_written += w
+                    with open(shard, "rb") as f:
+                        shutil.copyfileobj(f, fout, length=1 << 20)
+                    shard.unlink()
+    finally:
+        # A failed worker or Ctrl-C leaves the remaining shards behind; the pool
+        # has shut down by now, so nothing is still writing them
+        for _, shard, _ in shards:
+            shard.unlink(missing_ok=True)
 
     print(f"\nTotal   — read: {total_read:>6}  pairs written: {total_written:>6}")
     print(f"Output: {output_path.resolve()}")
@@ -1,35 +1,50 @@
 import asyncio
-import json
+import contextvars
 import logging
+from collections import OrderedDict
 import os
-import subprocess
-from typing import Any, AsyncIterator, Dict, List, Optional
+import time
+import uuid
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
 
 from dotenv import load_dotenv
-from fastapi import Body, FastAPI, HTTPException
-from fastapi.responses import StreamingResponse
+from fastapi import Body, FastAPI, HTTPException, Request
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, Field
 from google.adk.agents import Agent as GoogleAgent
+from google.adk.agents.run_config import RunConfig, StreamingMode
+from google.adk.errors.already_exists_error import AlreadyExistsError
 from google.adk.runners import Runner as GoogleRunner
+from google.adk.events.event import Event
+from google.adk.sessions.base_session_service import BaseSessionService, GetSessionConfig, ListSessionsResponse
 from google.adk.sessions.in_memory_session_service import InMemorySessionService as GoogleInMemorySessionService
+from google.adk.sessions.session import Session
 from google.adk.tools.mcp_tool import MCPToolset as GoogleMCPToolset
 from google.adk.tools.mcp_tool import StreamableHTTPConnectionParams as GoogleStreamableHTTPConnectionParams
 from google.genai import types
 import httpx
+import orjson
+import redis.asyncio as aioredis
+from kubernetes_asyncio import client as k8s_client
+from kubernetes_asyncio import config as k8s_config
+from kubernetes_asyncio.client.rest import ApiException
 
 load_dotenv()
 
 ALLOW_ORIGINS = [origin.strip() for origin in os.getenv("ALLOW_ORIGINS", "*").split(",") if origin.strip()]
-MCP_SERVER_URL = os.getenv("MCP_SERVER_URL", "http://localhost:3002/mcp")
+MCP_SERVER_URL = os.getenv("MCP_SERVER_URL", "http://localhost:3002/mcp").rstrip("/")
 CONVERSATION_HUB_URL = os.getenv("CONVERSATION_HUB_URL", "http://localhost:3300")
+REDIS_URL = os.getenv("REDIS_URL", "")
+SESSION_TTL = int(os.getenv("SESSION_TTL", "3600"))
 KUBE_NAMESPACE = os.getenv("KUBE_NAMESPACE", "todea")
 KUBE_SECRET_NAME = os.getenv("KUBE_SECRET_NAME", "todea-api-keys")
 
-# Runtime-mutable Kubernetes server URL. Empty string = use default kubeconfig (local cluster).
+# Runtime-mutable Kubernetes server URL. Empty string = use in-cluster config or default kubeconfig.
 _kube_server: str = os.getenv("KUBE_SERVER", "")
 PORT = int(os.environ.get("PORT", "3100"))
 GOOGLE_MODEL = os.getenv("AGENT_MODEL_GOOGLE", "gemini-2.5-flash")
@@ -42,6 +57,10 @@ GOOGLE_MODELS = [
     "gemini-1.5-pro",
     "gemini-1.5-flash",
 ]
+GOOGLE_MODELS_SET = frozenset(GOOGLE_MODELS)
+_UNKNOWN_MODEL_SUFFIX = f"Available: {GOOGLE_MODELS}"
+# Cap on cached runners (one per model); defaults to keeping every model warm
+MAX_RUNNERS = max(1, int(os.getenv("AGENT_MAX_RUNNERS", str(len(GOOGLE_MODELS)))))
 PROVIDER_ID = "google"
 APP_NAME = "todea-google"
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY") or os.getenv("GOOGLE_GENAI_API_KEY")
@@ -70,16 +89,70 @@ DEFAULT_INSTRUCTION = os.getenv(
     ),
 )
 
-app = FastAPI(title="Agent Hub Service")
+
+# X-Request-ID of the inbound request, forwarded on every conversation-hub call
+_request_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("request_id", default=None)
+
+
+async def _inject_request_id(request: httpx.Request) -> None:
+    rid = _request_id.get()
+    if rid:
+        request.headers["X-Request-ID"] = rid
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    # One pooled keep-alive client for every call to conversation-hub
+    global conv_client
+    app.state.http = httpx.AsyncClient(
+        base_url=CONVERSATION_HUB_URL,
+        event_hooks={"request": [_inject_request_id]},
+        limits=httpx.Limits(max_keepalive_connections=20, max_connections=100),
+        timeout=httpx.Timeout(10.0),
+    )
+    conv_client = ConversationHubClient(app.state.http)
+    # Build every runner now so the first chat per model doesn't pay for it
+    try:
+        # Default model last so it is the most recently used if the cap bites
+        warm = sorted(GOOGLE_MODELS, key=lambda m: m == GOOGLE_MODEL)
+        for model in warm[-MAX_RUNNERS:]:
+            get_runner(model)
+    except RuntimeError as exc:
+        logger.warning("Skipping runner pre-warm: %s", exc)
+    try:
+        yield
+    finally:
+        await app.state.http.aclose()
+        await _reset_kube_api()
+        if _mcp_toolset is not None:
+            await _mcp_toolset.close()
+        if isinstance(session_service, RedisSessionService):
+            await session_service.close()
+
+
+app = FastAPI(title="Agent Hub Service", lifespan=lifespan, default_response_class=ORJSONResponse)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=ALLOW_ORIGINS or ["*"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Request-ID"],
 )
 
 
+@app.middleware("http")
+async def request_id_middleware(request: Request, call_next):
+    rid = request.headers.get("X-Request-ID") or uuid.uuid4().hex
+    token = _request_id.set(rid)
+    try:
+        response = await call_next(request)
+    finally:
+        _request_id.reset(token)
+    response.headers["X-Request-ID"] = rid
+    return response
+
+
 # Models ---------------------------------------------------------------------
 
 class ChatRequest(BaseModel):
@@ -134,84 +207,293 @@ class ConversationUpdateRequest(BaseModel):
 
 # Conversation Hub client ----------------------------------------------------
 
+# Bodies are encoded with orjson up front, so the content type is set by hand
+_JSON_HEADERS = {"content-type": "application/json"}
+
+
 class ConversationHubClient:
     """Thin async HTTP client for the conversation-hub service."""
 
-    def __init__(self, base_url: str) -> None:
-        self._base = base_url.rstrip("/")
+    def __init__(self, client: httpx.AsyncClient) -> None:
+        self._client = client
+        # In-flight reads keyed by resource; concurrent identical reads share one call
+        self._inflight: Dict[str, asyncio.Task] = {}
+
+    def _coalesce(self, key: str, fetch: Callable[[], Awaitable[Any]]) -> Awaitable[Any]:
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fetch())
+            self._inflight[key] = task
+
+            def _done(t: asyncio.Task) -> None:
+                # A write may already have replaced this entry with a newer read
+                if self._inflight.get(key) is t:
+                    del self._inflight[key]
+
+            task.add_done_callback(_done)
+        # shield: one caller giving up must not cancel the read for the others
+        return asyncio.shield(task)
+
+    def _invalidate(self, conversation_id: Optional[str] = None) -> None:
+        # Called after a write: reads started before it may return stale data,
+        # so later callers must not join them
+        self._inflight.pop("list", None)
+        if conversation_id is not None:
+            self._inflight.pop(f"get:{conversation_id}", None)
 
     async def ensure(self, conversation_id: str, model: str, title: Optional[str] = None) -> Dict[str, Any]:
-        async with httpx.AsyncClient() as client:
-            resp = await client.post(
-                f"{self._base}/conversations/ensure",
-                json={"id": conversation_id, "model": model, "title": title},
-            )
-            resp.raise_for_status()
-            return resp.json()
+        resp = await self._client.post(
+            "/conversations/ensure",
+            content=orjson.dumps({"id": conversation_id, "model": model, "title": title}),
+            headers=_JSON_HEADERS,
+        )
+        self._invalidate(conversation_id)
+        resp.raise_for_status()
+        return orjson.loads(resp.content)
 
     async def append_message(self, conversation_id: str, role: str, content: str) -> None:
-        async with httpx.AsyncClient() as client:
-            resp = await client.post(
-                f"{self._base}/conversations/{conversation_id}/messages",
-                json={"role": role, "content": content},
-            )
-            resp.raise_for_status()
+        resp = await self._client.post(
+            f"/conversations/{conversation_id}/messages",
+            content=orjson.dumps({"role": role, "content": content}),
+            headers=_JSON_HEADERS,
+        )
+        self._invalidate(conversation_id)
+        resp.raise_for_status()
+
+    async def append_messages_bulk(self, conversation_id: str, messages: List[Dict[str, str]]) -> None:
+        # Appends all messages in order in a single round-trip
+        resp = await self._client.post(
+            f"/conversations/{conversation_id}/messages/batch",
+            content=orjson.dumps({"messages": messages}),
+            headers=_JSON_HEADERS,
+        )
+        self._invalidate(conversation_id)
+        if resp.status_code == 404:
+            raise KeyError(conversation_id)
+        resp.raise_for_status()
 
     async def get_messages(self, conversation_id: str) -> List[Dict[str, Any]]:
-        async with httpx.AsyncClient() as client:
-            resp = await client.get(f"{self._base}/conversations/{conversation_id}/messages")
-            if resp.status_code == 404:
-                return []
-            resp.raise_for_status()
-            return resp.json()
+        resp = await self._client.get(f"/conversations/{conversation_id}/messages")
+        if resp.status_code == 404:
+            return []
+        resp.raise_for_status()
+        return orjson.loads(resp.content)
 
     async def list(self) -> Dict[str, Any]:
-        async with httpx.AsyncClient() as client:
-            resp = await client.get(f"{self._base}/conversations")
-            resp.raise_for_status()
-            return resp.json()
+        return await self._coalesce("list", self._list)
+
+    async def _list(self) -> Dict[str, Any]:
+        resp = await self._client.get("/conversations")
+        resp.raise_for_status()
+        return orjson.loads(resp.content)
 
     async def create(self, title: Optional[str], model: str) -> Dict[str, Any]:
-        async with httpx.AsyncClient() as client:
-            resp = await client.post(
-                f"{self._base}/conversations",
-                json={"title": title, "model": model},
-            )
-            resp.raise_for_status()
-            return resp.json()
+        resp = await self._client.post(
+            "/conversations",
+            content=orjson.dumps({"title": title, "model": model}),
+            headers=_JSON_HEADERS,
+        )
+        self._invalidate()
+        resp.raise_for_status()
+        return orjson.loads(resp.content)
 
     async def get(self, conversation_id: str) -> Dict[str, Any]:
-        async with httpx.AsyncClient() as client:
-            resp = await client.get(f"{self._base}/conversations/{conversation_id}")
-            if resp.status_code == 404:
-                raise KeyError(conversation_id)
-            resp.raise_for_status()
-            return resp.json()
+        return await self._coalesce(f"get:{conversation_id}", lambda: self._get(conversation_id))
+
+    async def _get(self, conversation_id: str) -> Dict[str, Any]:
+        resp = await self._client.get(f"/conversations/{conversation_id}")
+        if resp.status_code == 404:
+            raise KeyError(conversation_id)
+        resp.raise_for_status()
+        return orjson.loads(resp.content)
 
     async def update_title(self, conversation_id: str, title: str) -> Dict[str, Any]:
-        async with httpx.AsyncClient() as client:
-            resp = await client.patch(
-                f"{self._base}/conversations/{conversation_id}",
-                json={"title": title},
-            )
-            if resp.status_code == 404:
-                raise KeyError(conversation_id)
-            resp.raise_for_status()
-            return resp.json()
+        resp = await self._client.patch(
+            f"/conversations/{conversation_id}",
+            content=orjson.dumps({"title": title}),
+            headers=_JSON_HEADERS,
+        )
+        self._invalidate(conversation_id)
+        if resp.status_code == 404:
+            raise KeyError(conversation_id)
+        resp.raise_for_status()
+        return orjson.loads(resp.content)
 
     async def delete(self, conversation_id: str) -> None:
-        async with httpx.AsyncClient() as client:
-            resp = await client.delete(f"{self._base}/conversations/{conversation_id}")
-            if resp.status_code == 404:
-                raise KeyError(conversation_id)
-            resp.raise_for_status()
+        resp = await self._client.delete(f"/conversations/{conversation_id}")
+        self._invalidate(conversation_id)
+        if resp.status_code == 404:
+            raise KeyError(conversation_id)
+        resp.raise_for_status()
+
+
+# Redis session store --------------------------------------------------------
+
+class RedisSessionService(BaseSessionService):
+    """ADK session service keeping each session as one JSON document in Redis.
+
+    Keys are ``sess:{app_name}:{user_id}:{session_id}`` and expire after ``ttl``
+    seconds without a read or write.
+    """
+
+    def __init__(self, url: str, ttl: int) -> None:
+        self._redis = aioredis.from_url(url)
+        self._ttl = ttl
+
+    @staticmethod
+    def _key(app_name: str, user_id: str, session_id: str) -> str:
+        return f"sess:{app_name}:{user_id}:{session_id}"
+
+    async def _save(self, session: Session) -> None:
+        await self._redis.set(
+            self._key(session.app_name, session.user_id, session.id),
+            session.model_dump_json(),
+            ex=self._ttl,
+        )
 
+    async def create_session(
+        self,
+        *,
+        app_name: str,
+        user_id: str,
+        state: Optional[Dict[str, Any]] = None,
+        session_id: Optional[str] = None,
+    ) -> Session:
+        session = Session(
+            id=(session_id or "").strip() or uuid.uuid4().hex,
+            app_name=app_name,
+            user_id=user_id,
+            state=dict(state or {}),
+            last_update_time=time.time(),
+        )
+        # NX so a caller-supplied id never clobbers a live session's history
+        created = await self._redis.set(
+            self._key(app_name, user_id, session.id),
+            session.model_dump_json(),
+            ex=self._ttl,
+            nx=True,
+        )
+        if not created:
+            raise AlreadyExistsError(f"Session with id {session.id} already exists.")
+        return session
+
+    async def get_session(
+        self,
+        *,
+        app_name: str,
+        user_id: str,
+        session_id: str,
+        config: Optional[GetSessionConfig] = None,
+    ) -> Optional[Session]:
+        # GETEX refreshes the TTL, so active sessions never expire
+        raw = await self._redis.getex(self._key(app_name, user_id, session_id), ex=self._ttl)
+        if raw is None:
+            return None
+        session = Session.model_validate_json(raw)
+        if config:
+            if config.after_timestamp:
+                session.events = [e for e in session.events if e.timestamp >= config.after_timestamp]
+            if config.num_recent_events:
+                session.events = session.events[-config.num_recent_events:]
+        return session
+
+    async def list_sessions(self, *, app_name: str, user_id: Optional[str] = None) -> ListSessionsResponse:
+        sessions = []
+        async for key in self._redis.scan_iter(match=self._key(app_name, user_id or "*", "*")):
+            raw = await self._redis.get(key)
+            if raw is not None:
+                session = Session.model_validate_json(raw)
+                session.events = []
+                sessions.append(session)
+        return ListSessionsResponse(sessions=sessions)
+
+    async def delete_session(self, *, app_name: str, user_id: str, session_id: str) -> None:
+        await self._redis.delete(self._key(app_name, user_id, session_id))
+
+    async def append_event(self, session: Session, event: Event) -> Event:
+        # The base class applies the state delta and appends to the in-memory
+        # session; persist it afterwards (partial events are never stored)
+        event = await super().append_event(session, event)
+        if not event.partial:
+            session.last_update_time = event.timestamp
+            await self._save(session)
+        return event
+
+    async def close(self) -> None:
+        await self._redis.aclose()
+
+
+# Bound to the shared pooled client in lifespan()
+conv_client: Optional[ConversationHubClient] = None
+
+# Sessions live in Redis when REDIS_URL is set (shared by every replica and kept
+# across restarts), otherwise in this process's memory
+session_service: Any = (
+    RedisSessionService(REDIS_URL, ttl=SESSION_TTL) if REDIS_URL else GoogleInMemorySessionService()
+)
+_mcp_toolset: Optional[Any] = None
+# Most recently used runner last; the oldest is dropped past MAX_RUNNERS
+_runners: "OrderedDict[str, Any]" = OrderedDict()
+# One lock per ADK session so concurrent chats only queue behind their own
+# session. Entries live only while a chat holds or waits for them, so the
+# table never outgrows the chats in flight.
+_session_locks: Dict[str, asyncio.Lock] = {}
+_session_lock_users: Dict[str, int] = {}
+
+
+@asynccontextmanager
+async def session_lock(session_id: str) -> AsyncIterator[None]:
+    # No await between the lookup and the count update, so no guard lock is needed
+    lock = _session_locks.setdefault(session_id, asyncio.Lock())
+    _session_lock_users[session_id] = _session_lock_users.get(session_id, 0) + 1
+    try:
+        async with lock:
+            yield
+    finally:
+        # Counted rather than lock.locked(): right after a release the next
+        # waiter is woken but doesn't hold the lock yet
+        users = _session_lock_users.pop(session_id) - 1
+        if users:
+            _session_lock_users[session_id] = users
+        else:
+            del _session_locks[session_id]
+
+
+# session_id -> (model, ensured_at) for conversations already ensured on
+# conversation-hub; follow-up turns skip the round-trip. The TTL bounds how
+# long a conversation-hub restart (which drops its in-memory store) goes unnoticed.
+ENSURED_SESSIONS_MAX = 10_000
+ENSURED_SESSIONS_TTL = 3600.0
+_ensured_sessions: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+
+
+async def ensure_conversation(session_id: str, model: str) -> None:
+    now = time.monotonic()
+    cached = _ensured_sessions.get(session_id)
+    # ensure() also records the model, so a model switch still goes through
+    if cached and cached[0] == model and now - cached[1] < ENSURED_SESSIONS_TTL:
+        _ensured_sessions.move_to_end(session_id)
+        return
+    await conv_client.ensure(session_id, model=model)
+    _ensured_sessions[session_id] = (model, now)
+    _ensured_sessions.move_to_end(session_id)
+    if len(_ensured_sessions) > ENSURED_SESSIONS_MAX:
+        _ensured_sessions.popitem(last=False)
 
-conv_client = ConversationHubClient(CONVERSATION_HUB_URL)
 
-session_service: Optional[Any] = None
-_runners: Dict[str, Any] = {}
-lock = asyncio.Lock()
+async def save_turn(session_id: str, model: str, user_text: str, assistant_text: str) -> None:
+    messages = [
+        {"role": "user", "content": user_text},
+        {"role": "assistant", "content": assistant_text},
+    ]
+    try:
+        await conv_client.append_messages_bulk(session_id, messages)
+    except KeyError:
+        # conversation-hub lost it (eviction, restart, or a delete elsewhere)
+        # while it was still cached as ensured: recreate it and retry once
+        _ensured_sessions.pop(session_id, None)
+        await ensure_conversation(session_id, model)
+        await conv_client.append_messages_bulk(session_id, messages)
 
 
 def ensure_google_credentials() -> None:
@@ -223,11 +505,18 @@ def ensure_google_credentials() -> None:
         )
 
 
-def build_agent(model: str) -> Any:
+def get_mcp_toolset() -> Any:
+    # The MCP tool list does not depend on the model, so every runner shares one toolset
+    global _mcp_toolset
+    if _mcp_toolset is None:
+        _mcp_toolset = GoogleMCPToolset(
+            connection_params=GoogleStreamableHTTPConnectionParams(url=MCP_SERVER_URL)
+        )
+    return _mcp_toolset
+
+
+def build_agent(model: str, tool_set: Any) -> Any:
     ensure_google_credentials()
-    tool_set = GoogleMCPToolset(
-        connection_params=GoogleStreamableHTTPConnectionParams(url=MCP_SERVER_URL.rstrip("/"))
-    )
     return GoogleAgent(
         name=f"{PROVIDER_ID}_agent",
         model=model,
@@ -238,17 +527,21 @@ def build_agent(model: str) -> Any:
 
 
 def get_runner(model: str) -> Any:
-    global session_service, _runners
-    if session_service is None:
-        session_service = GoogleInMemorySessionService()
-    if model not in _runners:
-        agent = build_agent(model)
-        _runners[model] = GoogleRunner(
-            app_name=APP_NAME,
-            agent=agent,
-            session_service=session_service,
-        )
-    return _runners[model]
+    runner = _runners.get(model)
+    if runner is not None:
+        _runners.move_to_end(model)
+        return runner
+    agent = build_agent(model, get_mcp_toolset())
+    runner = _runners[model] = GoogleRunner(
+        app_name=APP_NAME,
+        agent=agent,
+        session_service=session_service,
+    )
+    if len(_runners) > MAX_RUNNERS:
+        # Not closed: Runner.close() would also close the shared MCP toolset,
+        # and sessions live in session_service, so dropping it is enough
+        _runners.popitem(last=False)
+    return runner
 
 
 async def ensure_session(session_id: str) -> None:
@@ -259,32 +552,38 @@ async def ensure_session(session_id: str) -> None:
     )
     if existing:
         return
-    await session_service.create_session(
-        app_name=APP_NAME,
-        user_id="web-ui",
-        session_id=session_id,
-    )
+    try:
+        await session_service.create_session(
+            app_name=APP_NAME,
+            user_id="web-ui",
+            session_id=session_id,
+        )
+    except AlreadyExistsError:
+        # Another replica created it between the get and the create
+        pass
+
+
+def _iter_part_text(content: types.Content) -> Iterator[str]:
+    # Every branch yields non-empty text, so the join needs no extra filter
+    for part in content.parts or ():
+        if getattr(part, "text", None):
+            yield part.text
+        elif getattr(part, "function_call", None):
+            yield f"[function call] {part.function_call.name}"
+        elif getattr(part, "function_response", None):
+            fn = part.function_response
+            yield f"[function response] {fn.name}: {fn.response}"
+        elif getattr(part, "code_execution_result", None):
+            result = part.code_execution_result
+            output = getattr(result, "output", None) or getattr(result, "stdout", None)
+            if output:
+                yield str(output)
 
 
 def content_to_text(content: Optional[types.Content]) -> str:
     if not content:
         return ""
-    parts = []
-    if content.parts:
-        for part in content.parts:
-            if getattr(part, "text", None):
-                parts.append(part.text)
-            elif getattr(part, "function_call", None):
-                parts.append(f"[function call] {part.function_call.name}")
-            elif getattr(part, "function_response", None):
-                fn = part.function_response
-                parts.append(f"[function response] {fn.name}: {fn.response}")
-            elif getattr(part, "code_execution_result", None):
-                result = part.code_execution_result
-                output = getattr(result, "output", None) or getattr(result, "stdout", None)
-                if output:
-                    parts.append(str(output))
-    return "\n".join([p for p in parts if p]) or (getattr(content, "text", "") or "")
+    return "\n".join(_iter_part_text(content)) or (getattr(content, "text", "") or "")
 
 
 async def run_agent_chat(message: str, session_id: str, model: str) -> str:
@@ -301,14 +600,21 @@ async def run_agent_chat(message: str, session_id: str, model: str) -> str:
     ):
         if event.author != "web-ui" and event.is_final_response():
             final_response = content_to_text(event.content) or final_response
+        # Let other sessions run between events in case ADK did sync work
+        await asyncio.sleep(0)
 
     return final_response or "The agent did not return any text."
 
 
+# SSE streaming makes the runner emit partial text events while the model generates
+_STREAM_RUN_CONFIG = RunConfig(streaming_mode=StreamingMode.SSE)
+
+
 async def stream_agent_chat(message: str, session_id: str, model: str) -> AsyncIterator[Dict[str, Any]]:
     """Async generator that yields SSE-style event dicts as the agent processes a request.
 
     Event types:
+      {"type": "delta",       "content": "<text chunk as the model generates it>"}
       {"type": "thinking",    "content": "<model text>"}
       {"type": "tool_call",   "name": "<tool>", "args": {}}
       {"type": "tool_result", "name": "<tool>", "content": "<output>"}
@@ -331,10 +637,19 @@ async def stream_agent_chat(message: str, session_id: str, model: str) -> AsyncI
             user_id="web-ui",
             session_id=session_id,
             new_message=user_message,
+            run_config=_STREAM_RUN_CONFIG,
         ):
             if not event.content or not event.content.parts:
                 continue
 
+            # Partial events carry text chunks; the complete turn follows as a
+            # regular event, so deltas are forwarded and nothing else is done
+            if event.partial:
+                for part in event.content.parts:
+                    if getattr(part, "text", None):
+                        yield {"type": "delta", "content": part.text}
+                continue
+
             for part in event.content.parts:
                 if getattr(part, "text", None):
                     if event.is_final_response():
@@ -374,23 +689,22 @@ async def chat(request: ChatRequest) -> ChatResponse:
         raise HTTPException(status_code=400, detail="A message is required.")
 
     model = (request.model or GOOGLE_MODEL).strip() or GOOGLE_MODEL
-    if model not in GOOGLE_MODELS:
-        raise HTTPException(status_code=400, detail=f"Unknown model '{model}'. Available: {GOOGLE_MODELS}")
+    if model not in GOOGLE_MODELS_SET:
+        raise HTTPException(status_code=400, detail=f"Unknown model '{model}'. {_UNKNOWN_MODEL_SUFFIX}")
 
     session_id = (request.session_id or f"default-{PROVIDER_ID}").strip() or f"default-{PROVIDER_ID}"
 
-    await conv_client.ensure(session_id, model=model)
+    await ensure_conversation(session_id, model)
 
     try:
         get_runner(model)
     except RuntimeError as exc:
         raise HTTPException(status_code=500, detail=str(exc)) from exc
 
-    async with lock:
+    async with session_lock(session_id):
         content = await run_agent_chat(message, session_id, model)
 
-    await conv_client.append_message(session_id, "user", message)
-    await conv_client.append_message(session_id, "assistant", content)
+    await save_turn(session_id, model, message, content)
 
     return ChatResponse(content=content, provider=PROVIDER_ID, session_id=session_id)
 
@@ -402,11 +716,11 @@ async def chat_stream(request: ChatRequest) -> StreamingResponse:
         raise HTTPException(status_code=400, detail="A message is required.")
 
     model = (request.model or GOOGLE_MODEL).strip() or GOOGLE_MODEL
-    if model not in GOOGLE_MODELS:
-        raise HTTPException(status_code=400, detail=f"Unknown model '{model}'. Available: {GOOGLE_MODELS}")
+    if model not in GOOGLE_MODELS_SET:
+        raise HTTPException(status_code=400, detail=f"Unknown model '{model}'. {_UNKNOWN_MODEL_SUFFIX}")
 
     session_id = (request.session_id or f"default-{PROVIDER_ID}").strip() or f"default-{PROVIDER_ID}"
-    await conv_client.ensure(session_id, model=model)
+    await ensure_conversation(session_id, model)
 
     final_content: Dict[str, str] = {"value": ""}
 
@@ -414,10 +728,9 @@ async def chat_stream(request: ChatRequest) -> StreamingResponse:
         async for event in stream_agent_chat(message, session_id, model):
             if event.get("type") == "done":
                 final_content["value"] = event.get("content", "")
-            yield f"data: {json.dumps(event)}\n\n"
+            yield b"data: " + orjson.dumps(event) + b"\n\n"
         try:
-            await conv_client.append_message(session_id, "user", message)
-            await conv_client.append_message(session_id, "assistant", final_content["value"])
+            await save_turn(session_id, model, message, final_content["value"])
         except Exception as exc:
             logger.warning("Failed to save conversation after stream: %s", exc)
 
@@ -437,38 +750,39 @@ def _conversation_not_found(conversation_id: str) -> HTTPException:
     return HTTPException(status_code=404, detail=f"Conversation '{conversation_id}' not found.")
 
 
+# conversation-hub already validated these payloads; returning a Response skips
+# re-validating them here (response_model stays for the OpenAPI schema)
 @app.get("/conversations", response_model=ConversationListResponse)
-async def list_conversations() -> ConversationListResponse:
-    data = await conv_client.list()
-    return ConversationListResponse(**data)
+async def list_conversations() -> ORJSONResponse:
+    return ORJSONResponse(await conv_client.list())
 
 
 @app.post("/conversations", response_model=Conversation)
-async def create_conversation(request: ConversationCreateRequest) -> Conversation:
+async def create_conversation(request: ConversationCreateRequest) -> ORJSONResponse:
     model = (request.model or GOOGLE_MODEL).strip() or GOOGLE_MODEL
-    if model not in GOOGLE_MODELS:
-        raise HTTPException(status_code=400, detail=f"Unknown model '{model}'. Available: {GOOGLE_MODELS}")
+    if model not in GOOGLE_MODELS_SET:
+        raise HTTPException(status_code=400, detail=f"Unknown model '{model}'. {_UNKNOWN_MODEL_SUFFIX}")
 
     data = await conv_client.create(request.title, model=model)
-    return Conversation(**data)
+    return ORJSONResponse(data)
 
 
 @app.get("/conversations/{conversation_id}", response_model=Conversation)
-async def get_conversation(conversation_id: str) -> Conversation:
+async def get_conversation(conversation_id: str) -> ORJSONResponse:
     try:
         data = await conv_client.get(conversation_id)
     except KeyError:
         raise _conversation_not_found(conversation_id) from None
-    return Conversation(**data)
+    return ORJSONResponse(data)
 
 
 @app.patch("/conversations/{conversation_id}", response_model=Conversation)
-async def update_conversation(conversation_id: str, request: ConversationUpdateRequest) -> Conversation:
+async def update_conversation(conversation_id: str, request: ConversationUpdateRequest) -> ORJSONResponse:
     try:
         data = await conv_client.update_title(conversation_id, request.title)
     except KeyError:
         raise _conversation_not_found(conversation_id) from None
-    return Conversation(**data)
+    return ORJSONResponse(data)
 
 
 @app.delete("/conversations/{conversation_id}")
@@ -477,6 +791,7 @@ async def delete_conversation(conversation_id: str) -> Dict[str, str]:
         await conv_client.delete(conversation_id)
     except KeyError:
         raise _conversation_not_found(conversation_id) from None
+    _ensured_sessions.pop(conversation_id, None)
     return {"status": "deleted", "id": conversation_id}
 
 
@@ -498,52 +813,102 @@ class SettingsResponse(BaseModel):
     message: str
 
 
-def _kubectl(*args: str, stdin: Optional[str] = None, timeout: int = 30) -> subprocess.CompletedProcess:
-    cmd = ["kubectl"]
-    if _kube_server:
-        cmd += ["--server", _kube_server]
-    cmd += list(args)
-    try:
-        return subprocess.run(
-            cmd,
-            input=stdin,
-            capture_output=True,
-            text=True,
-            timeout=timeout,
-        )
-    except FileNotFoundError:
-        raise HTTPException(status_code=500, detail="kubectl not found. Ensure it is installed and on $PATH.")
-    except subprocess.TimeoutExpired:
-        raise HTTPException(status_code=500, detail="kubectl command timed out.")
+# Cached API client; rebuilt whenever the cluster URL changes
+_kube_api: Optional[k8s_client.ApiClient] = None
+# Serialises building and resetting _kube_api across the awaits in between
+_kube_api_lock = asyncio.Lock()
+
+
+async def _core_api() -> k8s_client.CoreV1Api:
+    global _kube_api
+    api = _kube_api
+    if api is None:
+        async with _kube_api_lock:
+            # Another request may have built it while this one waited
+            if _kube_api is None:
+                configuration = k8s_client.Configuration()
+                try:
+                    k8s_config.load_incluster_config(client_configuration=configuration)
+                except k8s_config.ConfigException:
+                    try:
+                        await k8s_config.load_kube_config(client_configuration=configuration)
+                    except (k8s_config.ConfigException, FileNotFoundError):
+                        raise HTTPException(status_code=500, detail="No Kubernetes configuration found (in-cluster or kubeconfig).")
+                if _kube_server:
+                    configuration.host = _kube_server
+                _kube_api = k8s_client.ApiClient(configuration)
+            api = _kube_api
+    return k8s_client.CoreV1Api(api)
+
+
+async def _reset_kube_api() -> None:
+    global _kube_api
+    async with _kube_api_lock:
+        if _kube_api is not None:
+            await _kube_api.close()
+            _kube_api = None
+
+
+# (checked_at, exists) from the last /settings/status lookup; the secret only
+# changes through save_settings, so UI polls can reuse it for a few seconds
+SETTINGS_STATUS_TTL = 10.0
+_status_cache: Optional[Tuple[float, bool]] = None
+
+
+# Constant part of the API-key Secret; save_settings only adds stringData
+_SECRET_SKELETON: Dict[str, Any] = {
+    "apiVersion": "v1",
+    "kind": "Secret",
+    "metadata": {"name": KUBE_SECRET_NAME, "namespace": KUBE_NAMESPACE},
+}
+
+
+def _kube_error(exc: ApiException, fallback: str) -> HTTPException:
+    return HTTPException(status_code=500, detail=exc.reason or fallback)
 
 
 @app.post("/settings", response_model=SettingsResponse)
 async def save_settings(request: SettingsRequest) -> SettingsResponse:
-    ns_result = _kubectl("get", "namespace", KUBE_NAMESPACE, "--ignore-not-found", "-o", "name")
-    if not ns_result.stdout.strip():
-        create_result = _kubectl("create", "namespace", KUBE_NAMESPACE)
-        if create_result.returncode != 0:
-            raise HTTPException(status_code=500, detail=create_result.stderr.strip() or "Failed to create namespace.")
-    manifest = json.dumps({
-        "apiVersion": "v1",
-        "kind": "Secret",
-        "metadata": {"name": KUBE_SECRET_NAME, "namespace": KUBE_NAMESPACE},
-        "stringData": {"GOOGLE_API_KEY": request.google_api_key},
-    })
-    result = _kubectl("apply", "-f", "-", stdin=manifest)
-    if result.returncode != 0:
-        raise HTTPException(status_code=500, detail=result.stderr.strip() or "kubectl apply failed.")
-    return SettingsResponse(status="ok", message=result.stdout.strip())
+    global _status_cache
+    core = await _core_api()
+    try:
+        await core.read_namespace(KUBE_NAMESPACE)
+    except ApiException as exc:
+        if exc.status != 404:
+            raise _kube_error(exc, "Failed to read namespace.") from exc
+        try:
+            await core.create_namespace({"metadata": {"name": KUBE_NAMESPACE}})
+        except ApiException as create_exc:
+            raise _kube_error(create_exc, "Failed to create namespace.") from create_exc
+    secret = {**_SECRET_SKELETON, "stringData": {"GOOGLE_API_KEY": request.google_api_key}}
+    try:
+        await core.patch_namespaced_secret(KUBE_SECRET_NAME, KUBE_NAMESPACE, secret)
+        action = "configured"
+    except ApiException as exc:
+        if exc.status != 404:
+            raise _kube_error(exc, "Failed to update secret.") from exc
+        try:
+            await core.create_namespaced_secret(KUBE_NAMESPACE, secret)
+        except ApiException as create_exc:
+            raise _kube_error(create_exc, "Failed to create secret.") from create_exc
+        action = "created"
+    _status_cache = None
+    return SettingsResponse(status="ok", message=f"secret/{KUBE_SECRET_NAME} {action}")
 
 
 @app.get("/settings/status")
 async def settings_status() -> Dict[str, Any]:
-    result = _kubectl(
-        "get", "secret", KUBE_SECRET_NAME,
-        "-n", KUBE_NAMESPACE,
-        "--ignore-not-found", "-o", "name",
-    )
-    return {"exists": bool(result.stdout.strip())}
+    global _status_cache
+    if _status_cache and time.monotonic() - _status_cache[0] < SETTINGS_STATUS_TTL:
+        return {"exists": _status_cache[1]}
+    core = await _core_api()
+    try:
+        await core.read_namespaced_secret(KUBE_SECRET_NAME, KUBE_NAMESPACE)
+        exists = True
+    except ApiException:
+        exists = False
+    _status_cache = (time.monotonic(), exists)
+    return {"exists": exists}
 
 
 class ClusterSettingsRequest(BaseModel):
@@ -561,12 +926,16 @@ async def get_cluster_settings() -> ClusterSettingsResponse:
 
 @app.post("/settings/cluster", response_model=ClusterSettingsResponse)
 async def save_cluster_settings(request: ClusterSettingsRequest) -> ClusterSettingsResponse:
-    global _kube_server
-    _kube_server = (request.kube_server or "").strip()
+    global _kube_server, _status_cache
+    kube_server = (request.kube_server or "").strip()
+    if kube_server != _kube_server:
+        _kube_server = kube_server
+        await _reset_kube_api()
+        _status_cache = None
     return ClusterSettingsResponse(kube_server=_kube_server)
 
 
 if __name__ == "__main__":
     import uvicorn
 
-    uvicorn.run("servers.agent-hub.app:app", host="0.0.0.0", port=PORT, reload=False)
+    uvicorn.run("servers.agent-hub.app:app", host="0.0.0.0", port=PORT, reload=False, loop="uvloop", http="httptools")
@@ -1,20 +1,55 @@
 import asyncio
+import json
+import logging
 import os
 import time
-from typing import Any, Dict, List, Optional
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from itertools import islice
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional
 from uuid import uuid4
 
 from dotenv import load_dotenv
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, Field
 
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
 load_dotenv()
 
 PORT = int(os.getenv("PORT", "3300"))
 ALLOW_ORIGINS = [o.strip() for o in os.getenv("ALLOW_ORIGINS", "*").split(",") if o.strip()]
-
-app = FastAPI(title="Conversation Hub Service")
+# Least recently used conversations are evicted past MAX_CONVERSATIONS; each
+# keeps only its newest MAX_MESSAGES_PER_CONV messages
+MAX_CONVERSATIONS = int(os.getenv("TODEA_MAX_CONVERSATIONS", "10000"))
+MAX_MESSAGES_PER_CONV = int(os.getenv("TODEA_MAX_MESSAGES_PER_CONV", "500"))
+# JSON-lines write-ahead log of store mutations; empty = memory only
+WAL_PATH = os.getenv("CONVERSATIONS_WAL_PATH", "")
+WAL_FLUSH_INTERVAL = 0.05
+WAL_FLUSH_BATCH = 256
+WAL_RETRY_DELAY = 1.0
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    if not WAL_PATH:
+        yield
+        return
+    global _wal_flusher
+    store.replay(WAL_PATH)
+    _wal_flusher = asyncio.create_task(_flush_wal(WAL_PATH))
+    _wal_flusher.add_done_callback(_log_flusher_exit)
+    try:
+        yield
+    finally:
+        # None tells the flusher to write what is queued and stop
+        store.wal.put_nowait(None)
+        await asyncio.gather(_wal_flusher, return_exceptions=True)
+
+
+app = FastAPI(title="Conversation Hub Service", lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=ALLOW_ORIGINS or ["*"],
@@ -76,15 +111,29 @@ class AppendMessageRequest(BaseModel):
     content: str
 
 
+class AppendMessagesRequest(BaseModel):
+    messages: List[AppendMessageRequest]
+
+
 # Store ----------------------------------------------------------------------
 
 class ConversationStore:
     """In-memory store for chat conversations and their message history."""
 
     def __init__(self) -> None:
-        self.conversations: Dict[str, Dict[str, Any]] = {}
-        self.messages: Dict[str, List[Dict[str, Any]]] = {}
+        # Most recently used last
+        self.conversations: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.messages: Dict[str, Deque[Dict[str, Any]]] = {}
         self._counter = 1
+        # Sorted summaries for /conversations; None after any write
+        self._summaries: Optional[List[ConversationSummary]] = None
+        # Mutation records waiting for the WAL flusher; None while replaying
+        # or when persistence is off
+        self.wal: Optional[asyncio.Queue] = asyncio.Queue() if WAL_PATH else None
+
+    def _log(self, record: Dict[str, Any]) -> None:
+        if self.wal is not None:
+            self.wal.put_nowait(record)
 
     def _now(self) -> float:
         return time.time()
@@ -105,35 +154,70 @@ class ConversationStore:
             "updated_at": now,
             "message_count": 0,
         }
-        self.conversations[conv_id] = conversation
-        self.messages[conv_id] = []
+        self._insert(conversation)
+        self._log({"op": "create", "conversation": dict(conversation)})
         return conversation
 
+    def _insert(self, conversation: Dict[str, Any], evict: bool = True) -> None:
+        conv_id = conversation["id"]
+        self.conversations[conv_id] = conversation
+        self.conversations.move_to_end(conv_id)
+        self.messages[conv_id] = deque(maxlen=MAX_MESSAGES_PER_CONV)
+        if evict:
+            self._evict_overflow()
+        self._summaries = None
+
+    def _evict_overflow(self) -> None:
+        while len(self.conversations) > MAX_CONVERSATIONS:
+            evicted, _ = self.conversations.popitem(last=False)
+            self.messages.pop(evicted, None)
+            self._log({"op": "evict", "id": evicted})
+
     def ensure(self, conversation_id: str, model: str, title: Optional[str] = None) -> Dict[str, Any]:
         existing = self.conversations.get(conversation_id)
         if existing:
-            existing["model"] = model
+            self.conversations.move_to_end(conversation_id)
+            if existing["model"] != model:
+                existing["model"] = model
+                self._summaries = None
+                self._log({"op": "model", "id": conversation_id, "model": model})
             return existing
         return self.create(title=title, model=model, conversation_id=conversation_id)
 
     def list(self) -> List[Dict[str, Any]]:
         return sorted(self.conversations.values(), key=lambda c: c["updated_at"], reverse=True)
 
+    def summaries(self) -> List[ConversationSummary]:
+        if self._summaries is None:
+            # Built from our own dicts, so validation can be skipped
+            self._summaries = [ConversationSummary.model_construct(**c) for c in self.list()]
+        return self._summaries
+
     def get(self, conversation_id: str) -> Dict[str, Any]:
         conversation = self.conversations.get(conversation_id)
         if not conversation:
             raise KeyError(conversation_id)
+        self.conversations.move_to_end(conversation_id)
         return conversation
 
     def update_title(self, conversation_id: str, title: str) -> Dict[str, Any]:
         conversation = self.get(conversation_id)
         conversation["title"] = title.strip() or conversation["title"]
         conversation["updated_at"] = self._now()
+        self._summaries = None
+        self._log({
+            "op": "title",
+            "id": conversation_id,
+            "title": conversation["title"],
+            "updated_at": conversation["updated_at"],
+        })
         return conversation
 
     def delete(self, conversation_id: str) -> None:
         self.conversations.pop(conversation_id, None)
         self.messages.pop(conversation_id, None)
+        self._summaries = None
+        self._log({"op": "delete", "id": conversation_id})
 
     def append_message(self, conversation_id: str, role: str, content: str) -> Dict[str, Any]:
         conversation = self.get(conversation_id)
@@ -142,11 +226,19 @@ class ConversationStore:
             "content": content,
             "timestamp": self._now(),
         }
-        self.messages.setdefault(conversation_id, []).append(entry)
+        messages = self.messages.setdefault(conversation_id, deque(maxlen=MAX_MESSAGES_PER_CONV))
+        messages.append(entry)
         conversation["updated_at"] = entry["timestamp"]
-        conversation["message_count"] = len(self.messages.get(conversation_id, []))
+        # Retained count: the deque drops the oldest message once it is full
+        conversation["message_count"] = len(messages)
+        self._summaries = None
+        self._log({"op": "append", "id": conversation_id, "entry": entry})
         return entry
 
+    def append_messages(self, conversation_id: str, messages: List[Dict[str, str]]) -> List[Dict[str, Any]]:
+        self.get(conversation_id)  # raises KeyError before anything is appended
+        return [self.append_message(conversation_id, m["role"], m["content"]) for m in messages]
+
     def detail(self, conversation_id: str) -> Dict[str, Any]:
         conversation = self.get(conversation_id)
         return {
@@ -154,13 +246,153 @@ class ConversationStore:
             "messages": list(self.messages.get(conversation_id, [])),
         }
 
-    def get_messages(self, conversation_id: str) -> List[Dict[str, Any]]:
+    def get_messages(self, conversation_id: str, window: Optional[int] = None) -> List[Dict[str, Any]]:
         self.get(conversation_id)  # raises KeyError if not found
-        return list(self.messages.get(conversation_id, []))
+        messages = self.messages.get(conversation_id, ())
+        if window is None:
+            return list(messages)
+        # Walk from the newest end so only `window` messages are touched
+        return list(islice(reversed(messages), window))[::-1]
+
+    def replay(self, path: str) -> None:
+        """Rebuild the store from the WAL, then compact it to one record per live item."""
+        wal, self.wal = self.wal, None
+        try:
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # A process killed mid-write leaves a torn last line;
+                        # the compaction below drops it. Anything after it
+                        # means real corruption, so that still fails.
+                        if any(rest.strip() for rest in f):
+                            raise
+                        logger.warning("Ignoring truncated last record in WAL %s", path)
+                        break
+                    self._apply(record)
+        except FileNotFoundError:
+            pass
+        else:
+            # Reads aren't logged, so recency is rebuilt from the last write;
+            # close enough for eviction. The cap applies only now: the log's
+            # evict records already removed what the live store dropped.
+            by_recency = sorted(self.conversations.values(), key=lambda c: c["updated_at"])
+            self.conversations = OrderedDict((c["id"], c) for c in by_recency)
+            self._evict_overflow()
+            self._summaries = None
+        finally:
+            self.wal = wal
+        records = []
+        for conversation in self.conversations.values():
+            records.append({"op": "create", "conversation": {**conversation, "message_count": 0}})
+            records.extend({"op": "append", "id": conversation["id"], "entry": e} for e in self.messages[conversation["id"]])
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write("".join(json.dumps(r) + "\n" for r in records))
+        os.replace(tmp, path)
+
+    def _apply(self, record: Dict[str, Any]) -> None:
+        op = record["op"]
+        if op == "create":
+            self._insert(dict(record["conversation"]), evict=False)
+            return
+        conversation = self.conversations.get(record["id"])
+        if conversation is None:
+            return  # deleted or evicted earlier in the log
+        if op == "evict":
+            self.conversations.pop(record["id"], None)
+            self.messages.pop(record["id"], None)
+        elif op == "append":
+            messages = self.messages[record["id"]]
+            messages.append(record["entry"])
+            # max(): a compacted log replays a later title change before the messages
+            conversation["updated_at"] = max(conversation["updated_at"], record["entry"]["timestamp"])
+            conversation["message_count"] = len(messages)
+        elif op == "model":
+            conversation["model"] = record["model"]
+        elif op == "title":
+            conversation["title"] = record["title"]
+            conversation["updated_at"] = record["updated_at"]
+        elif op == "delete":
+            self.delete(record["id"])
 
 
 store = ConversationStore()
-lock = asyncio.Lock()
+
+# Striped per-conversation locks: writers to different conversations never wait
+# on each other. Listing takes no lock, since it only snapshots the dict.
+LOCK_STRIPES = 64
+_stripes = [asyncio.Lock() for _ in range(LOCK_STRIPES)]
+
+
+def _stripe(conversation_id: str) -> asyncio.Lock:
+    return _stripes[hash(conversation_id) & (LOCK_STRIPES - 1)]
+
+
+# Write-behind persistence ---------------------------------------------------
+
+def _drain_wal(queue: Optional[asyncio.Queue], limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    records = []
+    while queue is not None and not queue.empty() and (limit is None or len(records) < limit):
+        records.append(queue.get_nowait())
+    return records
+
+
+def _append_wal(path: str, records: List[Dict[str, Any]]) -> None:
+    if not records:
+        return
+    with open(path, "a", encoding="utf-8") as f:
+        start = f.tell()
+        try:
+            f.write("".join(json.dumps(r) + "\n" for r in records))
+            f.flush()
+            os.fsync(f.fileno())
+        except OSError:
+            # Drop a partly written batch so the retry doesn't duplicate records
+            f.truncate(start)
+            raise
+
+
+async def _flush_wal(path: str) -> None:
+    """Append queued mutations to the WAL in batches, off the event loop.
+
+    A failed write keeps its batch and is retried every WAL_RETRY_DELAY seconds;
+    a stop request (None) writes what is queued and returns.
+    """
+    records: List[Optional[Dict[str, Any]]] = []
+    while True:
+        if not records:
+            records.append(await store.wal.get())
+            # Give concurrent writes a moment to join this batch
+            await asyncio.sleep(WAL_FLUSH_INTERVAL)
+        records += _drain_wal(store.wal, WAL_FLUSH_BATCH - len(records))
+        stopping = None in records
+        batch = [r for r in records if r is not None]
+        try:
+            await asyncio.to_thread(_append_wal, path, batch)
+        except OSError as exc:
+            if stopping:
+                logger.error("Dropping %d WAL records at shutdown: %s", len(batch), exc)
+                return
+            logger.warning("WAL write of %d records failed, retrying: %s", len(batch), exc)
+            records = batch
+            await asyncio.sleep(WAL_RETRY_DELAY)
+            continue
+        if stopping:
+            return
+        records = []
+
+
+def _log_flusher_exit(task: asyncio.Task) -> None:
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("WAL flusher stopped; changes are no longer persisted", exc_info=task.exception())
+
+
+# Background WAL writer; /healthz reports it once it has died
+_wal_flusher: Optional[asyncio.Task] = None
 
 
 # Helpers --------------------------------------------------------------------
@@ -169,54 +401,59 @@ def _not_found(conversation_id: str) -> HTTPException:
     return HTTPException(status_code=404, detail=f"Conversation '{conversation_id}' not found.")
 
 
+# Responses are built from the store's own dicts, so validation is skipped
+def _conversation(detail: Dict[str, Any]) -> Conversation:
+    messages = [ConversationMessage.model_construct(**m) for m in detail["messages"]]
+    return Conversation.model_construct(**{**detail, "messages": messages})
+
+
 # Routes ---------------------------------------------------------------------
 
 @app.get("/conversations", response_model=ConversationListResponse)
 async def list_conversations() -> ConversationListResponse:
-    async with lock:
-        summaries = [ConversationSummary(**c) for c in store.list()]
-    return ConversationListResponse(conversations=summaries)
+    return ConversationListResponse.model_construct(conversations=store.summaries())
 
 
 @app.post("/conversations", response_model=Conversation)
 async def create_conversation(request: ConversationCreateRequest) -> Conversation:
-    async with lock:
-        conversation = store.create(request.title, model=request.model, conversation_id=request.id)
-        detail = store.detail(conversation["id"])
-    return Conversation(**detail)
+    conversation_id = request.id or str(uuid4())
+    async with _stripe(conversation_id):
+        store.create(request.title, model=request.model, conversation_id=conversation_id)
+        detail = store.detail(conversation_id)
+    return _conversation(detail)
 
 
 @app.post("/conversations/ensure", response_model=ConversationSummary)
 async def ensure_conversation(request: ConversationEnsureRequest) -> ConversationSummary:
-    async with lock:
+    async with _stripe(request.id):
         conversation = store.ensure(request.id, model=request.model, title=request.title)
-    return ConversationSummary(**conversation)
+    return ConversationSummary.model_construct(**conversation)
 
 
 @app.get("/conversations/{conversation_id}", response_model=Conversation)
 async def get_conversation(conversation_id: str) -> Conversation:
-    async with lock:
+    async with _stripe(conversation_id):
         try:
             detail = store.detail(conversation_id)
         except KeyError:
             raise _not_found(conversation_id) from None
-    return Conversation(**detail)
+    return _conversation(detail)
 
 
 @app.patch("/conversations/{conversation_id}", response_model=Conversation)
 async def update_conversation(conversation_id: str, request: ConversationUpdateRequest) -> Conversation:
-    async with lock:
+    async with _stripe(conversation_id):
         try:
             store.update_title(conversation_id, request.title)
             detail = store.detail(conversation_id)
         except KeyError:
             raise _not_found(conversation_id) from None
-    return Conversation(**detail)
+    return _conversation(detail)
 
 
 @app.delete("/conversations/{conversation_id}")
 async def delete_conversation(conversation_id: str) -> Dict[str, str]:
-    async with lock:
+    async with _stripe(conversation_id):
         if conversation_id not in store.conversations:
             raise _not_found(conversation_id)
         store.delete(conversation_id)
@@ -225,26 +462,38 @@ async def delete_conversation(conversation_id: str) -> Dict[str, str]:
 
 @app.post("/conversations/{conversation_id}/messages", response_model=ConversationMessage)
 async def append_message(conversation_id: str, request: AppendMessageRequest) -> ConversationMessage:
-    async with lock:
+    async with _stripe(conversation_id):
         try:
             entry = store.append_message(conversation_id, request.role, request.content)
         except KeyError:
             raise _not_found(conversation_id) from None
-    return ConversationMessage(**entry)
+    return ConversationMessage.model_construct(**entry)
+
+
+@app.post("/conversations/{conversation_id}/messages/batch", response_model=List[ConversationMessage])
+async def append_messages(conversation_id: str, request: AppendMessagesRequest) -> List[ConversationMessage]:
+    async with _stripe(conversation_id):
+        try:
+            entries = store.append_messages(conversation_id, [m.model_dump() for m in request.messages])
+        except KeyError:
+            raise _not_found(conversation_id) from None
+    return [ConversationMessage.model_construct(**e) for e in entries]
 
 
 @app.get("/conversations/{conversation_id}/messages", response_model=List[ConversationMessage])
-async def get_messages(conversation_id: str) -> List[ConversationMessage]:
-    async with lock:
+async def get_messages(conversation_id: str, window: Optional[int] = Query(None, ge=1)) -> List[ConversationMessage]:
+    async with _stripe(conversation_id):
         try:
-            messages = store.get_messages(conversation_id)
+            messages = store.get_messages(conversation_id, window)
         except KeyError:
             raise _not_found(conversation_id) from None
-    return [ConversationMessage(**m) for m in messages]
+    return [ConversationMessage.model_construct(**m) for m in messages]
 
 
 @app.get("/healthz")
 async def health() -> Dict[str, str]:
+    if _wal_flusher is not None and _wal_flusher.done():
+        raise HTTPException(status_code=503, detail="WAL flusher is not running.")
     return {"status": "ok"}
 
 
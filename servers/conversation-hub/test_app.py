@@ -0,0 +1,66 @@
+import asyncio
+import json
+
+import pytest
+
+from app import ConversationStore
+
+
+def _write_wal(path, lines):
+    path.write_text("".join(lines), encoding="utf-8")
+
+
+def _create(conversation_id):
+    return json.dumps({
+        "op": "create",
+        "conversation": {
+            "id": conversation_id,
+            "title": "t",
+            "model": "m",
+            "created_at": 1.0,
+            "updated_at": 1.0,
+            "message_count": 0,
+        },
+    }) + "\n"
+
+
+def _append(conversation_id, content):
+    entry = {"role": "user", "content": content, "timestamp": 2.0}
+    return json.dumps({"op": "append", "id": conversation_id, "entry": entry}) + "\n"
+
+
+def test_replay_drops_torn_last_record(tmp_path):
+    wal = tmp_path / "wal.jsonl"
+    torn = _append("a", "lost")[:-10]
+    _write_wal(wal, [_create("a"), _append("a", "kept"), torn])
+
+    store = ConversationStore()
+    store.replay(str(wal))
+
+    assert [m["content"] for m in store.messages["a"]] == ["kept"]
+    # Compaction rewrote the log without the torn tail
+    records = [json.loads(line) for line in wal.read_text(encoding="utf-8").splitlines()]
+    assert [r["op"] for r in records] == ["create", "append"]
+
+
+def test_replay_fails_on_corruption_before_the_end(tmp_path):
+    wal = tmp_path / "wal.jsonl"
+    _write_wal(wal, [_create("a"), "{not json\n", _append("a", "after")])
+
+    with pytest.raises(json.JSONDecodeError):
+        ConversationStore().replay(str(wal))
+
+
+def test_replay_orders_by_last_write_and_skips_reads(tmp_path, monkeypatch):
+    wal = tmp_path / "wal.jsonl"
+    _write_wal(wal, [_create("a"), _create("b"), _append("a", "hi")])
+
+    store = ConversationStore()
+    store.replay(str(wal))
+    assert list(store.conversations) == ["b", "a"]
+
+    # A read reorders in memory but queues nothing for the WAL
+    monkeypatch.setattr(store, "wal", asyncio.Queue())
+    store.get("b")
+    assert list(store.conversations) == ["a", "b"]
+    assert store.wal.empty()
@@ -271,13 +271,22 @@ export default function Chat() {
 
             try {
                 const steps = [];
+                let streamed = '';
                 await streamChatRequest({
                     message: userContent,
                     provider: selectedProvider,
                     sessionId: conversationId,
                     model: selectedModel,
                     onEvent: (event) => {
-                        if (event.type === 'done') {
+                        if (event.type === 'delta') {
+                            streamed += event.content || '';
+                            setMessagesByConversation((prev) => {
+                                const updated = (prev[conversationId] || []).map((m) =>
+                                    m.id === placeholderId ? { ...m, content: streamed } : m
+                                );
+                                return { ...prev, [conversationId]: updated };
+                            });
+                        } else if (event.type === 'done') {
                             setMessagesByConversation((prev) => {
                                 const updated = (prev[conversationId] || []).map((m) =>
                                     m.id === placeholderId
@@ -296,10 +305,12 @@ export default function Chat() {
                                 return { ...prev, [conversationId]: updated };
                             });
                         } else {
+                            // Text streamed before a step was the model thinking, not the answer
                             steps.push(event);
+                            streamed = '';
                             setMessagesByConversation((prev) => {
                                 const updated = (prev[conversationId] || []).map((m) =>
-                                    m.id === placeholderId ? { ...m, steps: [...steps] } : m
+                                    m.id === placeholderId ? { ...m, content: streamed, steps: [...steps] } : m
                                 );
                                 return { ...prev, [conversationId]: updated };
                             });